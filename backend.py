@@ -2,20 +2,60 @@
 # -*- coding: utf-8 -*-
 """Lumora Backend - Detector Avançado de Imagens IA com ML"""
 
-from flask import Flask, request, jsonify, abort
+import time
+# Início do import (cold start reportado em /ready e /metrics)
+_IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, Request, Response, request, jsonify, abort
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import numpy as np
 import cv2
 from PIL import Image, ExifTags
-from scipy import fft, stats
 import io
 import re
 import os
+import sys
 import secrets
 import hashlib
+import json
+import struct
+import threading
+import queue
+import contextvars
+import functools
+import mmap
+import tempfile
+import zlib
+import operator
+import math
+import contextlib
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, BrokenExecutor, ThreadPoolExecutor, wait
+# Importados só quando usados: multiprocessing (executor 'process'), zipfile
+# (lotes), tracemalloc (TRACK_ALLOCATIONS), redis
+
+# Lote: máximo de imagens e de bytes por requisição em /analyze/batch
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '100'))
+BATCH_MAX_BYTES = int(os.environ.get('BATCH_MAX_BYTES', str(200 * 1024 * 1024)))
+# Uploads acima disto vão para um arquivo temporário e são lidos via mmap
+UPLOAD_SPOOL_THRESHOLD = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD', str(256 * 1024)))
+
+class LumoraRequest(Request):
+    """Limite de corpo por rota: só o endpoint de lote aceita mais que 10MB"""
+
+    @property
+    def max_content_length(self):
+        if self.path == '/analyze/batch':
+            return BATCH_MAX_BYTES
+        return app.config['MAX_CONTENT_LENGTH']
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Mesmo limiar do UploadBuffer: o que passa dele já está em disco
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD, mode='rb+')
 
 app = Flask(__name__)
+app.request_class = LumoraRequest
 
 # SEGURANÇA 1: Configurações Flask
 app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB máximo
@@ -47,10 +87,236 @@ MAGIC_BYTES = {
     b'BM': 'bmp'
 }
 
+# Limite de pixels por imagem (previne decompression bombs)
+MAX_PIXELS = 50_000_000
+
+# Lado máximo analisado; imagens maiores são reduzidas (JPEG já na decodificação)
+MAX_ANALYSIS_DIM = 4096
+
+DETECTOR_VERSION = '3.3'
+
+# Cache de resultados por conteúdo (0 entradas desativa o nível local)
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', '1024'))
+RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', '3600'))
+REDIS_URL = os.environ.get('REDIS_URL')
+# Depois de uma falha, o Redis é pulado por este intervalo (s) em vez de
+# cada requisição esperar o socket_timeout
+REDIS_COOLDOWN = float(os.environ.get('REDIS_COOLDOWN', '30'))
+
+# Índice de quase-duplicatas (dHash de 64 bits); sem caminho fica desligado
+PHASH_INDEX_PATH = os.environ.get('PHASH_INDEX_PATH')
+PHASH_MAX_DISTANCE = int(os.environ.get('PHASH_MAX_DISTANCE', '4'))
+# Capacidade do índice; cheio, a entrada mais antiga dá lugar à nova
+PHASH_INDEX_MAX_ENTRIES = int(os.environ.get('PHASH_INDEX_MAX_ENTRIES', '50000'))
+# Imagens lisas (cor sólida, muito desfocadas, gradiente puro) têm dHash quase
+# todo 0 ou 1 e "casariam" entre si: sem índice abaixo deste desvio padrão da
+# miniatura (níveis de cinza) ou com menos bits minoritários que isto
+PHASH_MIN_TEXTURE = float(os.environ.get('PHASH_MIN_TEXTURE', '2.0'))
+PHASH_MIN_BITS = int(os.environ.get('PHASH_MIN_BITS', '6'))
+
+# Memória máxima (bytes) dos planos espectrais memoizados por formato
+SPECTRAL_PLAN_CACHE_BYTES = int(os.environ.get('SPECTRAL_PLAN_CACHE_BYTES', str(64 * 1024 * 1024)))
+
+# Perfis de análise: ordem por custo + parada antecipada e resolução dos pixels.
+# 'tiled' analisa a resolução original em blocos de `tile` px (max_dim None);
+# a decodificação continua sendo da imagem inteira (ver _run_tiled)
+ANALYSIS_PROFILES = {
+    'fast': {'early_exit': True, 'max_dim': int(os.environ.get('FAST_PROXY_DIM', '1024'))},
+    'standard': {'early_exit': True, 'max_dim': MAX_ANALYSIS_DIM},
+    'full': {'early_exit': False, 'max_dim': MAX_ANALYSIS_DIM},
+    'tiled': {'early_exit': False, 'max_dim': None, 'tile': int(os.environ.get('TILE_SIZE', '1024'))},
+}
+# Probabilidade de IA a partir da qual um bloco destoa (com outro abaixo de 100 - isto)
+TILE_OUTLIER_PROBABILITY = float(os.environ.get('TILE_OUTLIER_PROBABILITY', '75'))
+DEFAULT_PROFILE = os.environ.get('ANALYSIS_PROFILE', 'full')
+
+# Animações (GIF/WebP): quadros amostrados para análise. 'first' só o primeiro,
+# 'every' um a cada ANIMATION_FRAME_STEP, 'keyframes' os quadros em que a cena
+# muda (diferença média de tons acima de ANIMATION_SCENE_THRESHOLD)
+ANIMATION_SAMPLING = os.environ.get('ANIMATION_SAMPLING', 'keyframes')
+ANIMATION_FRAME_STEP = int(os.environ.get('ANIMATION_FRAME_STEP', '10'))
+ANIMATION_SCENE_THRESHOLD = float(os.environ.get('ANIMATION_SCENE_THRESHOLD', '12'))
+ANIMATION_MAX_FRAMES = int(os.environ.get('ANIMATION_MAX_FRAMES', '8'))
+# Quadros percorridos no máximo (cada um é decodificado, mesmo sem ser analisado)
+ANIMATION_MAX_SCAN = int(os.environ.get('ANIMATION_MAX_SCAN', '500'))
+
+# Jobs assíncronos: backend ('memory' ou 'redis'), workers, fila e retenção.
+# 'memory' guarda os jobs no processo: só serve com um único worker do
+# gunicorn (com mais, GET /jobs/<id> cai em outro processo e dá 404)
+JOB_BACKEND = os.environ.get('JOB_BACKEND', 'memory')
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_QUEUE_DEPTH = int(os.environ.get('JOB_QUEUE_DEPTH', '16'))
+JOB_TTL = int(os.environ.get('JOB_TTL', '3600'))
+JOB_RETRY_AFTER = int(os.environ.get('JOB_RETRY_AFTER', '5'))
+# Redis: job sem renovação da posse por este tempo (s) volta para a fila
+# (worker morto); depois de JOB_MAX_ATTEMPTS tentativas, falha
+JOB_LEASE = int(os.environ.get('JOB_LEASE', '60'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+
+# Controle de admissão de /analyze; custo = megapixels decodificados.
+# 503 quando a fila estimada do worker passa de ADMISSION_MAX_WAIT segundos;
+# 429 quando o cliente estoura sua taxa (balde de MP) ou seus MP em análise
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '1') == '1'
+ADMISSION_BACKEND = os.environ.get('ADMISSION_BACKEND', 'memory')
+ADMISSION_MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT', '10'))
+# Estimativa inicial de segundos por megapixel, até as primeiras medidas
+ADMISSION_SECONDS_PER_MP = float(os.environ.get('ADMISSION_SECONDS_PER_MP', '0.1'))
+ADMISSION_MIN_COST = float(os.environ.get('ADMISSION_MIN_COST', '0.25'))
+ADMISSION_CLIENT_RATE = float(os.environ.get('ADMISSION_CLIENT_RATE', '8'))
+ADMISSION_CLIENT_BURST = float(os.environ.get('ADMISSION_CLIENT_BURST', '64'))
+ADMISSION_CLIENT_MAX_INFLIGHT = float(os.environ.get('ADMISSION_CLIENT_MAX_INFLIGHT', '32'))
+# Header com a identidade do cliente atrás de um proxy (ex.: X-Forwarded-For)
+ADMISSION_CLIENT_HEADER = os.environ.get('ADMISSION_CLIENT_HEADER')
+
+# Métricas (Server-Timing + Prometheus em /metrics); 0 desliga a instrumentação
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+# Pico de alocações por requisição via tracemalloc (custa CPU; para dimensionar workers)
+TRACK_ALLOCATIONS = os.environ.get('TRACK_ALLOCATIONS', '0') == '1'
+
+# Aquecimento no boot: 'background' (thread; /ready responde 503 até terminar),
+# 'sync' (durante o import; use com gunicorn --preload) ou 'off'
+WARMUP = os.environ.get('WARMUP', 'background')
+
+# Execução dos analisadores: 'thread' (pool compartilhado), 'process' (pool de
+# processos, imagem em memória compartilhada) ou 'serial'
+ANALYSIS_EXECUTOR = os.environ.get('ANALYSIS_EXECUTOR', 'thread')
+ANALYSIS_THREADS = int(os.environ.get('ANALYSIS_THREADS', min(4, os.cpu_count() or 1)))
+ANALYSIS_PROCESSES = int(os.environ.get('ANALYSIS_PROCESSES', os.cpu_count() or 1))
+# Processo filho do multiprocessing (pool do executor 'process', bulk_scan):
+# carrega só os analisadores, sem cache, índice, admissão, fila no Redis nem
+# aquecimento. O spawn nomeia o processo antes de importar este módulo;
+# workers do gunicorn (fork direto) continuam 'MainProcess'
+POOL_WORKER = 'multiprocessing' in sys.modules and \
+    sys.modules['multiprocessing'].current_process().name != 'MainProcess'
+# Orçamento de tempo por requisição em segundos (0 = sem prazo)
+ANALYSIS_TIMEOUT = float(os.environ.get('ANALYSIS_TIMEOUT', '0'))
+# Intervalo (s) em que uma análise cancelável confere se foi cancelada
+CANCEL_POLL_INTERVAL = 0.1
+
+class Histogram:
+    """Histograma no formato de exposição do Prometheus, com um rótulo opcional"""
+
+    def __init__(self, name, help, buckets, label=None):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.label = label
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_value=''):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_value, series in sorted(self._series.items()):
+                prefix = f'{self.label}="{label_value}",' if self.label else ''
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-1]}')
+                suffix = f'{{{prefix[:-1]}}}' if prefix else ''
+                lines.append(f'{self.name}_sum{suffix} {series[-2]}')
+                lines.append(f'{self.name}_count{suffix} {series[-1]}')
+        return lines
+
+class Metrics:
+    """Registro de métricas do processo (cada worker do gunicorn tem o seu)"""
+
+    def __init__(self):
+        self.stage_seconds = Histogram(
+            'lumora_stage_seconds', 'Duração de cada etapa da análise',
+            (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10), label='stage')
+        self.image_megapixels = Histogram(
+            'lumora_image_megapixels', 'Dimensão das imagens decodificadas',
+            (0.1, 0.5, 1, 2, 4, 8, 12, 16, 25, 50))
+        self.image_bytes = Histogram(
+            'lumora_image_bytes', 'Tamanho dos uploads processados',
+            (10_000, 100_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 10_000_000))
+        self.request_peak_alloc_bytes = Histogram(
+            'lumora_request_peak_alloc_bytes', 'Pico de memória alocada por requisição (TRACK_ALLOCATIONS=1)',
+            (1_000_000, 10_000_000, 50_000_000, 100_000_000, 250_000_000, 500_000_000, 1_000_000_000))
+        self.gauges = {}
+
+    def gauge(self, name, help, read, kind='gauge'):
+        """Registra um valor lido sob demanda (ex.: tamanho do cache, fila)"""
+        self.gauges[name] = (help, read, kind)
+
+    def render(self):
+        lines = []
+        for histogram in (self.stage_seconds, self.image_megapixels, self.image_bytes,
+                          self.request_peak_alloc_bytes):
+            lines.extend(histogram.render())
+        for name, (help, read, kind) in self.gauges.items():
+            try:
+                value = read()
+            except Exception:
+                continue
+            lines.extend([f'# HELP {name} {help}', f'# TYPE {name} {kind}', f'{name} {value}'])
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+# Tempos da requisição atual (para o header Server-Timing)
+_request_timings = contextvars.ContextVar('lumora_request_timings', default=None)
+# Memória rastreada no início da requisição (base do pico reportado)
+_request_alloc_base = contextvars.ContextVar('lumora_request_alloc_base', default=None)
+
+class _StageTimer:
+    """Mede uma etapa: alimenta o histograma e o Server-Timing da requisição"""
+
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_stage(self.stage, time.perf_counter() - self.start)
+        return False
+
+class _NullTimer:
+    """Instrumentação desligada: custo de uma chamada vazia"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def timed(stage):
+    """Context manager que cronometra uma etapa (no-op com METRICS_ENABLED=0)"""
+    if not METRICS_ENABLED:
+        return _NULL_TIMER
+    return _StageTimer(stage)
+
+def record_stage(stage, elapsed):
+    """Registra a duração de uma etapa (também as medidas em outro processo)"""
+    if not METRICS_ENABLED:
+        return
+    metrics.stage_seconds.observe(elapsed, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, elapsed))
+
 def validate_file_signature(data):
     """Valida assinatura de arquivo (previne spoofing)"""
+    head = bytes(data[:16])  # aceita memoryview/mmap sem copiar o resto
     for magic in MAGIC_BYTES.keys():
-        if data.startswith(magic):
+        if head.startswith(magic):
             return True
     return False
 
@@ -62,28 +328,368 @@ def sanitize_filename(filename):
     filename = re.sub(r'[^\w\s.-]', '', filename)
     return filename[:100]
 
-def validate_image_safety(data):
-    """Validações de segurança em imagens"""
-    try:
-        if not validate_file_signature(data):
-            return False, "Assinatura de arquivo inválida"
+class BufferReader(io.RawIOBase):
+    """Arquivo somente leitura sobre bytes/memoryview/mmap, sem copiar o buffer
+
+    io.BytesIO(data) copia o conteúdo inteiro; o PIL só precisa de
+    read/seek/tell para o cabeçalho e o verify().
+    """
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast('B')
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+class UploadBuffer:
+    """Conteúdo de um upload exposto sem cópia para `bytes`
+
+    Uploads pequenos são lidos normalmente. Acima de UPLOAD_SPOOL_THRESHOLD
+    o arquivo temporário do upload é mapeado em memória (mmap) e `data` é um
+    memoryview somente leitura repassado direto ao hash, à validação e ao
+    decoder. Streams já em memória (itens de zip) são lidos direto: o
+    BytesIO devolve os próprios bytes. Use como context manager: o
+    mapeamento é liberado ao sair.
+    """
+
+    def __init__(self, stream, threshold=UPLOAD_SPOOL_THRESHOLD):
+        self._mmap = None
+        self._spool = None
+        stream.seek(0, io.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+        if size < threshold or size == 0 or isinstance(stream, io.BytesIO):
+            self.data = stream.read()
+            return
         
-        img = Image.open(io.BytesIO(data))
+        if isinstance(stream, tempfile.SpooledTemporaryFile):
+            stream.rollover()
+        try:
+            fileno = stream.fileno()
+        except (AttributeError, OSError):
+            # Stream sem arquivo por trás: copia em blocos para um temporário
+            self._spool = tempfile.TemporaryFile()
+            while True:
+                chunk = stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                self._spool.write(chunk)
+            self._spool.flush()
+            fileno = self._spool.fileno()
+        self._mmap = mmap.mmap(fileno, size, access=mmap.ACCESS_READ)
+        self.data = memoryview(self._mmap)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        # Decode, hash e validação não guardam views de `data`; se alguma
+        # escapou, o mmap só é solto quando ela morrer (o GC fecha o mapeamento)
+        if isinstance(self.data, memoryview):
+            try:
+                self.data.release()
+            except BufferError as e:
+                app.logger.warning("upload ainda exportado ao fechar, memoryview não liberado: %s", e)
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError as e:
+                app.logger.warning("upload ainda exportado ao fechar, mmap não liberado: %s", e)
+            self._mmap = None
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+class ImageRejected(ValueError):
+    """Imagem recusada pelas validações (mensagem segura para o cliente)"""
+
+class DecodedImage:
+    """Imagem decodificada uma única vez por requisição
+
+    Compartilhada entre validação, EXIF e análise para evitar que os mesmos
+    bytes sejam decodificados várias vezes.
+    """
+
+    def __init__(self, data, pixels, width, height, format, exif, animated=False):
+        self.data = data
+        self.pixels = pixels  # BGR uint8 em resolução original (primeiro quadro)
+        self.width = width
+        self.height = height
+        self.format = format
+        self.exif = exif
+        self.animated = animated  # GIF/WebP com mais de um quadro
+
+def read_exif(img):
+    """Extrai EXIF de uma imagem PIL já aberta (não decodifica pixels)"""
+    exif_data = {}
+    # Só lê o EXIF já presente no cabeçalho: _getexif() sem ele força um load()
+    exif = img._getexif() if 'exif' in img.info and hasattr(img, '_getexif') else None
+    if exif:
+        for tag_id, value in exif.items():
+            tag = ExifTags.TAGS.get(tag_id, tag_id)
+            exif_data[tag] = str(value)
+    return exif_data
+
+def _jpeg_size(data):
+    """Percorre os segmentos JPEG até o SOFn (sem decodificar)"""
+    pos, end = 2, len(data)
+    while pos + 4 <= end:
+        if data[pos] != 0xFF:
+            raise ImageRejected("Imagem inválida")
+        marker = data[pos + 1]
+        if marker == 0xFF:  # bytes de preenchimento
+            pos += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:  # sem comprimento
+            pos += 2
+            continue
+        length = struct.unpack_from('>H', data, pos + 2)[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if pos + 9 > end:
+                break
+            height, width = struct.unpack_from('>HH', data, pos + 5)
+            return width, height
+        if marker in (0xD9, 0xDA) or length < 2:  # EOI/SOS antes do SOF
+            break
+        pos += 2 + length
+    raise ImageRejected("Imagem inválida")
+
+def _webp_size(data):
+    """Dimensões do canvas WebP (VP8, VP8L ou VP8X)"""
+    chunk = bytes(data[12:16])
+    if chunk == b'VP8 ' and bytes(data[23:26]) == b'\x9d\x01\x2a':
+        width, height = struct.unpack_from('<HH', data, 26)
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and data[20] == 0x2F:
+        bits = struct.unpack_from('<I', data, 21)[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        width = int.from_bytes(data[24:27], 'little') + 1
+        height = int.from_bytes(data[27:30], 'little') + 1
+        return width, height
+    raise ImageRejected("Imagem inválida")
+
+def probe_image_header(data):
+    """Formato e dimensões lidos direto do cabeçalho (antes de qualquer decodificação)
+
+    Estende a checagem de MAGIC_BYTES: além da assinatura, valida a
+    estrutura mínima de cada formato. Retorna (formato, largura, altura) ou
+    levanta ImageRejected.
+    """
+    head = bytes(data[:32])
+    if len(head) < 26:
+        raise ImageRejected("Imagem inválida")
+    try:
+        if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+            fmt = 'png'
+            width, height = struct.unpack_from('>II', head, 16)
+        elif head.startswith((b'GIF87a', b'GIF89a')):
+            fmt = 'gif'
+            width, height = struct.unpack_from('<HH', head, 6)
+        elif head.startswith(b'BM'):
+            fmt = 'bmp'
+            if struct.unpack_from('<I', head, 14)[0] == 12:  # BITMAPCOREHEADER
+                width, height = struct.unpack_from('<HH', head, 18)
+            else:
+                width, height = struct.unpack_from('<ii', head, 18)
+            width, height = abs(width), abs(height)  # altura negativa = top-down
+        elif head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+            fmt = 'webp'
+            width, height = _webp_size(data)
+        elif head.startswith(b'\xff\xd8\xff'):
+            fmt = 'jpeg'
+            width, height = _jpeg_size(data)
+        else:
+            raise ImageRejected("Assinatura de arquivo inválida")
+    except (struct.error, IndexError):
+        raise ImageRejected("Imagem inválida")
+    
+    if width <= 0 or height <= 0:
+        raise ImageRejected("Imagem inválida")
+    # SEGURANÇA 5: Limites de dimensão checados antes de alocar pixels
+    if width * height > MAX_PIXELS:
+        raise ImageRejected("Imagem muito grande")
+    return fmt, width, height
+
+def _reduced_jpeg_flag(width, height, max_dim):
+    """Modo IMREAD_REDUCED_* que decodifica o JPEG já perto de max_dim
+
+    Usa o maior fator (8, 4, 2) que deixa o lado maior em pelo menos 90% de
+    max_dim (ex.: 8000px -> 4000px para o alvo de 4096); o resize de
+    analyze_image faz o ajuste fino a partir daí.
+    """
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if max(width, height) // factor >= max_dim * 0.9:
+            return flag
+    return cv2.IMREAD_COLOR
+
+def decode_image(data, max_dim=MAX_ANALYSIS_DIM):
+    """Decodifica a imagem uma única vez: cabeçalho/EXIF via PIL, pixels via OpenCV
+
+    Dimensões vêm do cabeçalho (probe_image_header), então bombas são
+    recusadas sem alocar pixels. JPEGs maiores que `max_dim` são
+    decodificados já em escala reduzida; `max_dim=None` força resolução total.
+    """
+    fmt, width, height = probe_image_header(data)
+    with BufferReader(data) as fp:
+        img = Image.open(fp)
         
-        # SEGURANÇA 5: Limites de dimensão (previne memory exhaustion)
-        MAX_PIXELS = 50_000_000
-        if img.width * img.height > MAX_PIXELS:
-            return False, "Imagem muito grande"
+        with timed('extract_exif'):
+            try:
+                exif = read_exif(img)
+            except Exception:
+                exif = {}
+        # Só lê o cabeçalho do segundo quadro, se houver (n_frames percorreria todos)
+        animated = bool(getattr(img, 'is_animated', False))
         
+        # verify() só checa a estrutura; a única decodificação completa é a do OpenCV
         img.verify()
-        img = Image.open(io.BytesIO(data))
-        
-        if img.mode not in ('RGB', 'L'):
-            img = img.convert('RGB')
+    flag = cv2.IMREAD_COLOR
+    if fmt == 'jpeg' and max_dim:
+        flag = _reduced_jpeg_flag(width, height, max_dim)
+    # A view NumPy dos bytes do upload não sobrevive ao decode: com ela viva,
+    # o UploadBuffer não consegue soltar o mmap
+    encoded = np.frombuffer(data, np.uint8)
+    try:
+        with timed('decode'):
+            pixels = cv2.imdecode(encoded, flag)
+    finally:
+        del encoded
+    if pixels is None:
+        raise ImageRejected("Imagem inválida")
+    
+    return DecodedImage(data, pixels, width, height, fmt, exif, animated)
+
+class FrameSampler:
+    """Quadros amostrados de uma animação, decodificados um a um (PIL)
+
+    Iterar produz (índice, pixels BGR) só dos quadros escolhidos pela
+    política (ANIMATION_SAMPLING); os demais são decodificados e descartados,
+    então a memória fica em um ou dois quadros qualquer que seja a duração.
+    Ao fim, `scanned` tem quantos quadros foram percorridos.
+    """
+
+    def __init__(self, data, policy=None, step=None, max_frames=None, max_scan=None, threshold=None):
+        self.data = data
+        self.policy = policy or ANIMATION_SAMPLING
+        self.step = max(1, step or ANIMATION_FRAME_STEP)
+        self.max_frames = 1 if self.policy == 'first' else max_frames or ANIMATION_MAX_FRAMES
+        self.max_scan = max_scan or ANIMATION_MAX_SCAN
+        self.threshold = ANIMATION_SCENE_THRESHOLD if threshold is None else threshold
+        self.scanned = 0
+    
+    def __iter__(self):
+        sampled = 0
+        reference = None
+        with BufferReader(self.data) as fp:
+            img = Image.open(fp)
+            for index in range(self.max_scan):
+                if sampled >= self.max_frames:
+                    break
+                try:
+                    img.seek(index)
+                except EOFError:
+                    break
+                self.scanned = index + 1
+                if self.policy == 'keyframes':
+                    # Miniatura em cinza do último quadro escolhido como referência de cena
+                    thumb = np.asarray(img.convert('L').resize((32, 32), Image.BILINEAR), dtype=np.int16)
+                    if reference is not None and np.mean(np.abs(thumb - reference)) < self.threshold:
+                        continue
+                    reference = thumb
+                elif index % self.step:
+                    continue
+                sampled += 1
+                yield index, cv2.cvtColor(np.asarray(img.convert('RGB')), cv2.COLOR_RGB2BGR)
+
+def validate_image_safety(data, max_dim=MAX_ANALYSIS_DIM):
+    """Validações de segurança em imagens
+
+    Retorna (is_safe, message, decoded); a imagem decodificada é repassada
+    para detector.analyze_image. `max_dim` segue para decode_image.
+    """
+    try:
+        if not validate_file_signature(data):
+            return False, "Assinatura de arquivo inválida", None
         
-        return True, "OK"
+        with timed('validate'):
+            decoded = decode_image(data, max_dim)
+        return True, "OK", decoded
+    except ImageRejected as e:
+        return False, str(e), None
     except Exception as e:
-        return False, f"Imagem inválida"
+        return False, f"Imagem inválida", None
+
+@app.before_request
+def start_request_timings():
+    """Abre a coleta de tempos por etapa desta requisição"""
+    if METRICS_ENABLED:
+        _request_timings.set([])
+    if TRACK_ALLOCATIONS:
+        import tracemalloc
+        # O pico do tracemalloc é do processo: com requisições concorrentes
+        # o valor reportado é um limite superior
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        _request_alloc_base.set(tracemalloc.get_traced_memory()[0])
+
+@app.after_request
+def add_server_timing(response):
+    """Expõe os tempos por etapa no header Server-Timing"""
+    timings = _request_timings.get()
+    if timings:
+        # Etapas repetidas (ex.: um analisador por bloco) aparecem somadas
+        totals = {}
+        for stage, elapsed in timings:
+            totals[stage] = totals.get(stage, 0) + elapsed
+        response.headers['Server-Timing'] = ', '.join(
+            f'{stage};dur={elapsed * 1000:.1f}' for stage, elapsed in totals.items())
+    _request_timings.set(None)
+    return response
+
+@app.after_request
+def add_peak_allocation(response):
+    """Expõe o pico de alocações da requisição (TRACK_ALLOCATIONS=1)"""
+    base = _request_alloc_base.get()
+    if base is not None:
+        import tracemalloc
+        peak = max(0, tracemalloc.get_traced_memory()[1] - base)
+        metrics.request_peak_alloc_bytes.observe(peak)
+        response.headers['X-Peak-Alloc'] = str(peak)
+        _request_alloc_base.set(None)
+    return response
 
 @app.after_request
 def add_security_headers(response):
@@ -97,81 +703,1071 @@ def add_security_headers(response):
     response.headers['Permissions-Policy'] = 'geolocation=(), microphone=(), camera=()'
     return response
 
+def histogram_entropy(counts):
+    """Entropia de Shannon (nats) de um histograma, como scipy.stats.entropy(counts)
+
+    Mesma precisão do scipy (float32 segue float32), sem importar o scipy.
+    """
+    p = 1.0 * np.asarray(counts).ravel()
+    p = p / p.sum()
+    p = p[p > 0]
+    return float(-np.sum(p * np.log(p)))
+
+def block_stats(gray, block_size):
+    """Média e variância de todos os blocos block_size x block_size em uma passada
+
+    Usa reshape (sem cópia) sobre a mesma grade dos laços originais: o
+    último bloco completo de cada borda fica de fora. Retorna arrays (ny, nx).
+    """
+    h, w = gray.shape[:2]
+    ny, nx = max(0, (h - 1) // block_size), max(0, (w - 1) // block_size)
+    n = block_size * block_size
+    blocks = gray[:ny * block_size, :nx * block_size].reshape(ny, block_size, nx, block_size)
+    
+    # Somas inteiras exatas; quadrados de uint8 cabem em uint16
+    sums = blocks.sum(axis=(1, 3), dtype=np.int64)
+    sq_sums = np.square(blocks, dtype=np.uint16).sum(axis=(1, 3), dtype=np.int64)
+    
+    means = sums / n
+    variances = (sq_sums * n - sums * sums) / (n * n)
+    return means, variances
+
+def block_boundary_diffs(gray, block_size=8):
+    """Descontinuidade média nas fronteiras da grade de blocos
+
+    Retorna (linhas, colunas): média de |p[k] - p[k-1]| nas fronteiras
+    horizontais e verticais, ou None quando a imagem não tem fronteiras.
+    """
+    h, w = gray.shape[:2]
+    rows = cols = None
+    if h > 2 * block_size:
+        after = gray[block_size:h - block_size:block_size, :]
+        before = gray[block_size - 1:h - block_size - 1:block_size, :]
+        rows = float(np.mean(np.abs(after.astype(np.int16) - before)))
+    if w > 2 * block_size:
+        after = gray[:, block_size:w - block_size:block_size]
+        before = gray[:, block_size - 1:w - block_size - 1:block_size]
+        cols = float(np.mean(np.abs(after.astype(np.int16) - before)))
+    return rows, cols
+
+def gradient_magnitude_stats(gray, bins=50, strip_rows=512):
+    """Desvio padrão e histograma (`bins` faixas entre mín. e máx.) de |∇| via Sobel 3x3
+
+    Processa a imagem em faixas horizontais (com 1 linha de margem para o
+    kernel), sem manter Sobel ou magnitude da imagem inteira. Os quadrados
+    da magnitude são inteiros exatos em int32; a contagem de cada valor
+    (bincount) reproduz os mesmos desvio e histograma do cálculo em float64.
+    """
+    h = gray.shape[0]
+    counts = np.zeros(1, dtype=np.int64)
+    for y0 in range(0, h, strip_rows):
+        y1 = min(h, y0 + strip_rows)
+        top, bottom = max(0, y0 - 1), min(h, y1 + 1)
+        strip = gray[top:bottom]
+        gx = cv2.Sobel(strip, cv2.CV_16S, 1, 0, ksize=3)[y0 - top:y1 - top]
+        gy = cv2.Sobel(strip, cv2.CV_16S, 0, 1, ksize=3)[y0 - top:y1 - top]
+        
+        # |gx|, |gy| <= 1020: gx² + gy² cabe em int32
+        mag_sq = np.square(gx, dtype=np.int32)
+        mag_sq += np.square(gy, dtype=np.int32)
+        strip_counts = np.bincount(mag_sq.ravel())
+        if len(strip_counts) > len(counts):
+            strip_counts[:len(counts)] += counts
+            counts = strip_counts
+        else:
+            counts[:len(strip_counts)] += strip_counts
+    
+    values = np.flatnonzero(counts)
+    weights = counts[values]
+    magnitudes = np.sqrt(values)
+    mean = np.average(magnitudes, weights=weights)
+    std = float(np.sqrt(np.average((magnitudes - mean) ** 2, weights=weights)))
+    hist, _ = np.histogram(magnitudes, bins=bins, weights=weights)
+    return std, hist.astype(np.int64)
+
+def _half_plane_index(height, width, rows, cols):
+    """Posições no rfft2 (height x width//2+1) dos pontos rows x cols do espectro centrado
+
+    `rows`/`cols` são fatias do espectro completo após fftshift. Para entrada
+    real |F(v, u)| = |F(-v, -u)|: frequências horizontais negativas são lidas
+    no ponto espelhado da metade calculada.
+    """
+    v = np.arange(height)[rows][:, None] - height // 2
+    u = np.arange(width)[cols][None, :] - width // 2
+    v, u = np.broadcast_arrays(v, u)
+    v = np.where(u < 0, -v, v) % height
+    return (v * (width // 2 + 1) + np.abs(u)).ravel()
+
+def _ccs_to_half_plane(ccs):
+    """Converte a saída compacta (CCS) de cv2.dft em entrada real para o layout do rfft2
+
+    cv2.dft sem DFT_COMPLEX_OUTPUT é bem mais rápido que np.fft.rfft2, mas
+    empacota as colunas u=0 e u=Nyquist como DFTs 1-D reais ao longo da
+    coluna; as demais colunas vêm como pares (Re, Im).
+    """
+    height, width = ccs.shape
+    half = np.empty((height, width // 2 + 1), dtype=np.complex64)
+    k = (width - 1) // 2
+    half[:, 1:k + 1].real = ccs[:, 1:2 * k:2]
+    half[:, 1:k + 1].imag = ccs[:, 2:2 * k + 1:2]
+    columns = [(0, 0)] + ([(width // 2, width - 1)] if width % 2 == 0 else [])
+    j = (height - 1) // 2
+    for column, source in columns:
+        packed = ccs[:, source]
+        line = half[:, column]
+        line[0] = packed[0]
+        line[1:j + 1].real = packed[1:2 * j:2]
+        line[1:j + 1].imag = packed[2:2 * j + 1:2]
+        if height % 2 == 0:
+            line[height // 2] = packed[height - 1]
+        # Simetria hermitiana: F(-v) = conj(F(v))
+        line[height - j:] = np.conj(line[1:j + 1][::-1])
+    return half
+
+class SpectralPlan:
+    """Tudo o que depende só do formato da imagem, calculado uma vez (spectral_plan)
+
+    Tamanho ótimo de DFT, janela de Hann, índice do anel radial de cada
+    frequência da metade calculada e as posições das regiões usadas na
+    razão baixas/altas frequências.
+    """
+
+    def __init__(self, height, width, bins):
+        self.shape = (height, width)
+        self.padded = (cv2.getOptimalDFTSize(height), cv2.getOptimalDFTSize(width))
+        self.window = np.outer(np.hanning(height), np.hanning(width)).astype(np.float32)
+        
+        ph, pw = self.padded
+        # Mesmas regiões de antes: caixa 60x60 central e 30 linhas do topo/base
+        self.low = _half_plane_index(ph, pw, slice(ph // 2 - 30, ph // 2 + 30), slice(pw // 2 - 30, pw // 2 + 30))
+        self.high = np.concatenate([_half_plane_index(ph, pw, slice(0, 30), slice(None)),
+                                    _half_plane_index(ph, pw, slice(-30, None), slice(None))])
+        
+        # Raio normalizado (1 = Nyquist nos eixos); fora do círculo inscrito fica de fora
+        fy = np.fft.fftfreq(ph)[:, None]
+        fx = np.fft.rfftfreq(pw)[None, :]
+        radius = np.sqrt(fy ** 2 + fx ** 2) * 2
+        self.radial_bins = np.minimum(radius * bins, bins).astype(np.intp).ravel()
+        # Colunas internas da metade valem por duas (u e -u)
+        weights = np.full((ph, pw // 2 + 1), 2.0)
+        weights[:, 0] = 1
+        if pw % 2 == 0:
+            weights[:, -1] = 1
+        self.radial_weights = weights.ravel()
+        self.radial_counts = np.bincount(self.radial_bins, self.radial_weights, bins + 1)[:bins]
+        self.bins = bins
+        self.nbytes = sum(array.nbytes for array in (self.window, self.low, self.high, self.radial_bins,
+                                                     self.radial_weights, self.radial_counts))
+
+_spectral_plans = OrderedDict()
+_spectral_plans_bytes = 0
+_spectral_plans_lock = threading.Lock()
+
+def spectral_plan(height, width, bins=64):
+    """SpectralPlan memoizado por formato (imagens reduzidas a 512px repetem muito)
+
+    LRU limitado por bytes (SPECTRAL_PLAN_CACHE_BYTES), não por entradas: um
+    plano de 4096px passa de 200 MB. Plano maior que o limite é calculado
+    e descartado, sem esvaziar o cache.
+    """
+    global _spectral_plans_bytes
+    key = (height, width, bins)
+    with _spectral_plans_lock:
+        plan = _spectral_plans.get(key)
+        if plan is not None:
+            _spectral_plans.move_to_end(key)
+            return plan
+    
+    plan = SpectralPlan(height, width, bins)
+    if plan.nbytes > SPECTRAL_PLAN_CACHE_BYTES:
+        return plan
+    with _spectral_plans_lock:
+        if key not in _spectral_plans:
+            _spectral_plans[key] = plan
+            _spectral_plans_bytes += plan.nbytes
+        while _spectral_plans_bytes > SPECTRAL_PLAN_CACHE_BYTES:
+            _, evicted = _spectral_plans.popitem(last=False)
+            _spectral_plans_bytes -= evicted.nbytes
+    return plan
+
+def spectral_features(gray, bins=64):
+    """Razão baixas/altas frequências e espectro de potência radial (média azimutal)
+
+    Transformadas reais (cv2.dft, layout do rfft2) em tamanho ótimo de DFT. A razão usa o
+    log-magnitude só nas regiões que entram nela, com borda refletida no
+    preenchimento (mesmo valor da DFT complexa original a ~0,1%). O perfil
+    radial usa a imagem com janela de Hann, preenchida com zeros, e tem
+    `bins` anéis entre a frequência zero e a de Nyquist.
+    """
+    plan = spectral_plan(gray.shape[0], gray.shape[1], bins)
+    (h, w), (ph, pw) = plan.shape, plan.padded
+    image = np.float32(gray)
+    
+    padded = cv2.copyMakeBorder(image, 0, ph - h, 0, pw - w, cv2.BORDER_REFLECT_101)
+    spectrum = _ccs_to_half_plane(cv2.dft(padded)).ravel()
+    low = np.log(np.abs(spectrum[plan.low]) + 1)
+    high = np.log(np.abs(spectrum[plan.high]) + 1)
+    ratio = np.mean(low) / (np.mean(high) + 1e-10)
+    
+    windowed = cv2.copyMakeBorder((image - image.mean()) * plan.window, 0, ph - h, 0, pw - w,
+                                  cv2.BORDER_CONSTANT, value=0)
+    spectrum = _ccs_to_half_plane(cv2.dft(windowed)).ravel()
+    power = spectrum.real ** 2 + spectrum.imag ** 2
+    sums = np.bincount(plan.radial_bins, power * plan.radial_weights, bins + 1)[:bins]
+    profile = sums / np.maximum(plan.radial_counts, 1)
+    return ratio, profile
+
+def radial_profile_fit(profile):
+    """Inclinação do log-potência vs log-frequência e excesso nas altas frequências
+
+    Fotos seguem ~1/f^2 (inclinação perto de -2); upsampling de GANs deixa
+    um excesso de energia no último quarto do espectro, medido como o
+    resíduo médio (log10) acima da reta ajustada.
+    """
+    bins = len(profile)
+    radius = (np.arange(1, bins) + 0.5) / bins
+    log_power = np.log10(profile[1:] + 1e-12)
+    log_radius = np.log10(radius)
+    slope, intercept = np.polyfit(log_radius, log_power, 1)
+    tail = slice(3 * (bins - 1) // 4, None)
+    hf_excess = np.mean(log_power[tail] - (slope * log_radius[tail] + intercept))
+    return float(slope), float(hf_excess)
+
+class ColorStats:
+    """Estatísticas de cor dos analisadores de cor e de saturação
+
+    Uma passada em faixas de `strip_rows` linhas do BGR original, sem
+    cópias RGB/HSV da imagem inteira: cada faixa acumula o histograma do
+    vermelho, o da saturação (HSV só da faixa; média e desvio saem do
+    histograma, exatos) e os pixels da amostra de passo fixo usada nas
+    correlações entre canais (mesmos índices de sempre, resultado
+    reprodutível). A memória é a de uma faixa, não a da imagem.
+    """
+
+    def __init__(self, img, sample_size=10000, strip_rows=128):
+        h, w = img.shape[:2]
+        pixels = h * w
+        indices = np.linspace(0, pixels - 1, min(sample_size, pixels)).astype(np.int64)
+        samples = np.empty((len(indices), 3), dtype=np.uint8)
+        red_hist = np.zeros((256, 1), dtype=np.float32)
+        sat_hist = np.zeros((256, 1), dtype=np.float32)
+        for y0 in range(0, h, strip_rows):
+            y1 = min(y0 + strip_rows, h)
+            strip = img[y0:y1]
+            cv2.calcHist([strip], [2], None, [256], [0, 256], red_hist, accumulate=True)
+            cv2.calcHist([cv2.cvtColor(strip, cv2.COLOR_BGR2HSV)], [1], None, [256], [0, 256],
+                         sat_hist, accumulate=True)
+            first, last = np.searchsorted(indices, (y0 * w, y1 * w))
+            samples[first:last] = strip.reshape(-1, 3)[indices[first:last] - y0 * w]
+        
+        self.red_hist = red_hist
+        levels = np.arange(256, dtype=np.float64)
+        counts = sat_hist.ravel().astype(np.float64)
+        self.saturation_mean = float(levels @ counts / pixels)
+        self.saturation_std = float(np.sqrt(max(0.0, (levels ** 2) @ counts / pixels - self.saturation_mean ** 2)))
+        # Correlações entre canais (matriz 3x3, ordem BGR)
+        self.correlation = np.corrcoef(samples.T)
+
+def channel_edge_disagreement(img):
+    """absdiff médio dos mapas de bordas (0 ou 255), R contra G e R contra B
+
+    Só a aberração cromática usa. Fica na imagem inteira: a histerese do
+    Canny segue bordas fracas por qualquer distância, e Canny por faixas
+    muda o valor em imagens suaves. Os canais são processados um por vez
+    (dois mapas de bordas vivos, não três).
+    """
+    pixels = img.shape[0] * img.shape[1]
+    edges_r = cv2.Canny(cv2.extractChannel(img, 2), 50, 150)
+    return tuple(cv2.norm(edges_r, cv2.Canny(cv2.extractChannel(img, channel), 50, 150), cv2.NORM_L1) / pixels
+                 for channel in (1, 0))
+
+# Produtos intermediários compartilhados entre analisadores: nome -> (função, dependências)
+FEATURE_PRODUCTS = {
+    'gray': (lambda ctx: cv2.cvtColor(ctx.img, cv2.COLOR_BGR2GRAY), ()),
+    'color_stats': (lambda ctx: ColorStats(ctx.img), ()),
+    'channel_edges': (lambda ctx: channel_edge_disagreement(ctx.img), ()),
+    # Laplaciano 3x3 de uint8 fica em [-1020, 1020]: int16 é exato e 4x menor que float64
+    'laplacian': (lambda ctx: cv2.Laplacian(ctx.get('gray'), cv2.CV_16S), ('gray',)),
+    'canny': (lambda ctx: cv2.Canny(ctx.get('gray'), 50, 150), ('gray',)),
+}
+
+# Medidas numéricas que os analisadores registram via ctx.record, em ordem fixa
+FEATURE_NAMES = (
+    'filename_keyword', 'filename_pattern', 'exif_tags', 'exif_camera', 'exif_exposure',
+    'frequency_ratio', 'spectral_slope', 'spectral_hf_excess', 'gan_var_of_vars', 'gan_mean_var',
+    'sharpness', 'laplacian_entropy', 'jpeg_grid_rows', 'jpeg_grid_cols',
+    'noise_std', 'noise_mean', 'color_correlation', 'red_entropy',
+    'gradient_std', 'gradient_entropy', 'chromatic_aberration',
+    'edge_mean_size', 'edge_size_std', 'saturation_mean', 'saturation_std',
+)
+
+# Regras de pontuação sobre FEATURE_NAMES: analisador -> regras avaliadas em
+# ordem (vale a primeira satisfeita), cada uma (impacto, fração do peso,
+# condições). Todas as condições (medida, operador, limiar) precisam valer;
+# medida ausente (NaN) nunca satisfaz uma condição.
+SCORING_RULES = {
+    'filename': (
+        ('ai', 1.0, (('filename_keyword', '>', 0),)),
+        ('ai', 0.6, (('filename_pattern', '>', 0),)),
+    ),
+    'exif': (
+        ('ai', 0.4, (('exif_tags', '==', 0),)),
+        ('real', 1.0, (('exif_camera', '>', 0), ('exif_exposure', '>', 0))),
+    ),
+    'frequency_analysis': (
+        ('ai', 1.0, (('frequency_ratio', '>', 15),)),
+        ('real', 0.85, (('frequency_ratio', '<', 5),)),
+    ),
+    'gan_artifacts': (
+        ('ai', 1.0, (('gan_var_of_vars', '<', 500), ('gan_mean_var', '<', 100))),
+        ('real', 0.75, (('gan_var_of_vars', '>', 2000),)),
+    ),
+    'unnatural_sharpness': (
+        ('ai', 1.0, (('sharpness', '>', 1500), ('laplacian_entropy', '<', 2.5))),
+        ('real', 0.7, (('sharpness', '>', 200), ('sharpness', '<', 800), ('laplacian_entropy', '>', 3.0))),
+    ),
+    'jpeg_grid': (
+        ('real', 0.8, (('jpeg_grid_rows', '>', 3.0),)),
+        ('ai', 0.6, (('jpeg_grid_rows', '<', 0.5),)),
+    ),
+    'noise_consistency': (
+        ('ai', 1.0, (('noise_std', '<', 1.0), ('noise_mean', '<', 5.0))),
+        ('real', 0.8, (('noise_std', '>', 3.0), ('noise_mean', '>', 8.0))),
+    ),
+    'color_distribution': (
+        ('ai', 1.0, (('color_correlation', '>', 0.95), ('red_entropy', '<', 6.0))),
+        ('real', 0.75, (('color_correlation', '<', 0.75), ('red_entropy', '>', 7.0))),
+    ),
+    'gradient_analysis': (
+        ('ai', 1.0, (('gradient_std', '<', 10), ('gradient_entropy', '<', 3.0))),
+        ('real', 0.7, (('gradient_std', '>', 30), ('gradient_entropy', '>', 4.0))),
+    ),
+    'chromatic_aberration': (
+        ('real', 1.0, (('chromatic_aberration', '>', 2.0),)),
+        ('ai', 0.6, (('chromatic_aberration', '<', 0.5),)),
+    ),
+    'edge_coherence': (
+        ('ai', 1.0, (('edge_size_std', '<', 5), ('edge_mean_size', '<', 10))),
+        ('real', 0.7, (('edge_size_std', '>', 50), ('edge_mean_size', '>', 30))),
+    ),
+    'saturation_analysis': (
+        ('ai', 1.0, (('saturation_mean', '>', 180), ('saturation_std', '<', 30))),
+        ('real', 0.6, (('saturation_mean', '>', 80), ('saturation_mean', '<', 150), ('saturation_std', '>', 40))),
+    ),
+}
+
+# Operadores das condições: funcionam com escalares e com colunas NumPy
+_RULE_OPS = {'<': operator.lt, '>': operator.gt, '==': operator.eq}
+
+def feature_vector(features):
+    """Vetor float de len(FEATURE_NAMES) a partir de ctx.features (NaN = não medido)"""
+    return np.array([features.get(name, np.nan) for name in FEATURE_NAMES], dtype=np.float64)
+
+class RuleScorer:
+    """Pontuação por regras: SCORING_RULES + pesos do detector
+
+    As mesmas regras decidem o achado de cada analisador em uma imagem
+    (match) e pontuam uma matriz N x F inteira em uma chamada (score):
+    mudar um limiar ou peso e repontuar um acervo não exige decodificar nada.
+    """
+
+    def __init__(self, weights, rules=None):
+        self.weights = weights
+        self.rules = rules or SCORING_RULES
+        self._columns = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+    def weight(self, analyzer, rule):
+        """Peso de uma regra (fração do peso do analisador, truncada)"""
+        return int(self.weights[analyzer] * self.rules[analyzer][rule][1])
+
+    def match(self, analyzer, features):
+        """Índice da primeira regra que as medidas (dict) satisfazem, ou None"""
+        for i, (_, _, conditions) in enumerate(self.rules[analyzer]):
+            if all(_RULE_OPS[op](features.get(name, np.nan), limit) for name, op, limit in conditions):
+                return i
+        return None
+
+    def score(self, features):
+        """Placar de N imagens (matriz N x len(FEATURE_NAMES)): arrays ai, real e aiProbability"""
+        features = np.atleast_2d(np.asarray(features, dtype=np.float64))
+        ai = np.zeros(len(features))
+        real = np.zeros(len(features))
+        for analyzer, rules in self.rules.items():
+            free = np.ones(len(features), dtype=bool)
+            for i, (impact, _, conditions) in enumerate(rules):
+                hit = free.copy()
+                for name, op, limit in conditions:
+                    hit &= _RULE_OPS[op](features[:, self._columns[name]], limit)
+                (ai if impact == 'ai' else real)[hit] += self.weight(analyzer, i)
+                free &= ~hit
+        total = ai + real
+        probability = np.divide(ai, total, out=np.full(len(features), 0.5), where=total > 0) * 100
+        return {'ai': ai, 'real': real, 'aiProbability': probability}
+
+class LogisticScorer:
+    """Modelo alternativo às regras: aiProbability = 100 * sigmoide(X . coef + intercept)
+
+    Medidas ausentes (NaN) são trocadas por `fill` (ex.: médias do treino).
+    """
+
+    def __init__(self, coef, intercept=0.0, fill=None):
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.fill = np.zeros(len(FEATURE_NAMES)) if fill is None else np.asarray(fill, dtype=np.float64)
+
+    @classmethod
+    def load(cls, path):
+        """Modelo em JSON: {"intercept": b, "coef": {medida: c}, "fill": {medida: v}}"""
+        with open(path) as f:
+            model = json.load(f)
+        coef = [model['coef'].get(name, 0.0) for name in FEATURE_NAMES]
+        fill = [model.get('fill', {}).get(name, 0.0) for name in FEATURE_NAMES]
+        return cls(coef, model.get('intercept', 0.0), fill)
+
+    def score(self, features):
+        features = np.atleast_2d(np.asarray(features, dtype=np.float64))
+        features = np.where(np.isnan(features), self.fill, features)
+        logits = features @ self.coef + self.intercept
+        return {'aiProbability': 100 / (1 + np.exp(-logits))}
+
+def requires(*products):
+    """Declara os produtos intermediários que um analisador consome"""
+    def decorator(method):
+        method.requires = products
+        return method
+    return decorator
+
+class FeatureContext:
+    """Contexto de uma análise: produtos intermediários sob demanda e memoizados
+
+    Cada produto (cinza, Laplaciano, Sobel, Canny...) é calculado no máximo
+    uma vez por requisição. Com as dependências declaradas via @requires,
+    um produto é liberado assim que o último analisador que o usa termina.
+    As medidas brutas de cada analisador ficam em `features` (FEATURE_NAMES).
+    """
+
+    def __init__(self, img, filename='', exif=None, analyzers=(), products=None):
+        self.img = img
+        self.filename = filename
+        self.exif = exif or {}
+        self.features = {}
+        # `products`: intermediários já calculados (ex.: vindos da memória compartilhada)
+        self._products = dict(products or {})
+        self._pending = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        for analyzer in analyzers:
+            for name in self._expand(getattr(analyzer, 'requires', ())):
+                self._pending[name] = self._pending.get(name, 0) + 1
+
+    def _expand(self, names):
+        """Inclui dependências transitivas dos produtos"""
+        expanded = []
+        for name in names:
+            expanded.extend(self._expand(FEATURE_PRODUCTS[name][1]))
+            expanded.append(name)
+        return list(dict.fromkeys(expanded))
+
+    def get(self, name):
+        """Retorna o produto, calculando-o na primeira solicitação
+
+        Seguro entre threads: analisadores concorrentes que pedem o mesmo
+        produto esperam um único cálculo.
+        """
+        product = self._products.get(name)
+        if product is not None:
+            return product
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._products:
+                self._products[name] = FEATURE_PRODUCTS[name][0](self)
+            return self._products[name]
+
+    def record(self, **values):
+        """Guarda medidas numéricas de um analisador (antes descartadas)"""
+        self.features.update((name, float(value)) for name, value in values.items())
+
+    def done(self, analyzer):
+        """Libera produtos que nenhum analisador pendente ainda usa"""
+        with self._lock:
+            for name in self._expand(getattr(analyzer, 'requires', ())):
+                self._pending[name] -= 1
+                if self._pending[name] <= 0:
+                    self._products.pop(name, None)
+
+def deadline_passed(deadline=None, cancel=None):
+    """Prazo (time.monotonic) estourado ou `cancel` (threading.Event) sinalizado"""
+    if cancel is not None and cancel.is_set():
+        return True
+    return deadline is not None and time.monotonic() >= deadline
+
+_analysis_pool = None
+_analysis_pool_lock = threading.Lock()
+
+def get_analysis_pool():
+    """Pool de threads compartilhado (criado sob demanda, após o fork do gunicorn)"""
+    global _analysis_pool
+    with _analysis_pool_lock:
+        if _analysis_pool is None:
+            _analysis_pool = ThreadPoolExecutor(max_workers=ANALYSIS_THREADS,
+                                                thread_name_prefix='lumora-analyzer')
+        return _analysis_pool
+
+_process_pool = None
+_worker_detector = None
+
+def get_process_pool():
+    """Pool de processos persistente do executor 'process'
+
+    Usa spawn: os workers não herdam as threads (Flask, pool, OpenCV) do
+    processo que os cria.
+    """
+    global _process_pool
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    with _analysis_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=ANALYSIS_PROCESSES,
+                                                mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=_init_process_worker)
+        return _process_pool
+
+def discard_process_pool(pool):
+    """Descarta um pool quebrado (worker morto); o próximo pedido cria outro"""
+    global _process_pool
+    with _analysis_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _init_process_worker():
+    """Worker do pool de processos: o detector do módulo (POOL_WORKER: sem cache nem índice)"""
+    global _worker_detector
+    import multiprocessing
+    # Paralelismo vem dos processos: sem threads do OpenCV disputando núcleos
+    cv2.setNumThreads(1)
+    _worker_detector = detector
+    # Órfão não fica vivo: sem workers, o resource_tracker remove os segmentos
+    # de um processo pai que morreu (SIGKILL, OOM)
+    parent = multiprocessing.parent_process()
+    if parent is not None:
+        threading.Thread(target=lambda: (parent.join(), os._exit(1)), daemon=True).start()
+
+def _attach_segment(name):
+    """Abre um segmento criado por outro processo sem registrá-lo no resource_tracker
+
+    O tracker é compartilhado com o processo pai: registrar (e depois
+    desregistrar) aqui apagaria o registro do dono, que é quem remove o
+    segmento, inclusive se ele morrer.
+    """
+    from multiprocessing import resource_tracker, shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 não tem track=False
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+def _run_shared_analyzers(segments, filename, exif, names):
+    """Roda um grupo de analisadores no worker sobre dados em memória compartilhada
+
+    `segments` traz (produto, segmento, formato, dtype), com produto None
+    para a imagem; os outros entram prontos no FeatureContext. Os pixels
+    são lidos direto dos segmentos (sem cópia nem pickle) e o grupo divide
+    os intermediários calculados aqui. Retorna ([(nome, resultado,
+    segundos)], medidas).
+    """
+    opened = [(product, _attach_segment(segment), shape, dtype) for product, segment, shape, dtype in segments]
+    try:
+        arrays = {product: np.ndarray(shape, dtype, buffer=shm.buf) for product, shm, shape, dtype in opened}
+        analyzers = dict(_worker_detector.analyzers)
+        group = [analyzers[name] for name in names]
+        ctx = FeatureContext(arrays.pop(None), filename, exif, group, arrays)
+        results = []
+        for name, analyzer in zip(names, group):
+            start = time.perf_counter()
+            result = analyzer(ctx)
+            results.append((name, result, time.perf_counter() - start))
+            ctx.done(analyzer)
+        features = ctx.features
+        # Nenhuma view dos segmentos pode sobreviver ao close()
+        del ctx, arrays
+        return results, features
+    finally:
+        for _, shm, _, _ in opened:
+            try:
+                shm.close()
+            except BufferError:
+                # Erro num analisador: o traceback ainda segura views; o
+                # mapeamento sai com ele (o dono remove o segmento)
+                pass
+
+class SharedImage:
+    """Cópia única de uma imagem em multiprocessing.shared_memory
+
+    Quem cria é o dono: close() remove o segmento. Workers que ainda o
+    têm aberto continuam lendo; um worker que morre não deixa nada para
+    trás, e o resource_tracker remove o segmento se o dono morrer.
+    """
+
+    def __init__(self, img):
+        from multiprocessing import shared_memory
+        self.shape = img.shape
+        self.dtype = img.dtype.str
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, img.nbytes))
+        np.ndarray(img.shape, img.dtype, buffer=self._shm.buf)[...] = img
+        self.name = self._shm.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+class CircuitBreaker:
+    """Disjuntor de um serviço externo (Redis): aberto, as chamadas são puladas
+
+    Uma falha abre o disjuntor por `cooldown` segundos. Passado o intervalo,
+    uma única chamada testa o serviço (as outras continuam pulando); se
+    der certo, o disjuntor fecha.
+    """
+
+    def __init__(self, cooldown=REDIS_COOLDOWN):
+        self.cooldown = cooldown
+        self.failures = 0
+        self._open = False
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True se a chamada deve tentar o serviço"""
+        if not self._open:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if now < self._retry_at:
+                return False
+            # Esta chamada é o teste: as demais esperam o próximo intervalo
+            self._retry_at = now + self.cooldown
+            return True
+
+    def succeeded(self):
+        self._open = False
+
+    def failed(self):
+        with self._lock:
+            self.failures += 1
+            self._open = True
+            self._retry_at = time.monotonic() + self.cooldown
+
+class ResultCache:
+    """Cache de resultados em dois níveis: LRU local com TTL + Redis opcional
+
+    O nível Redis é compartilhado entre workers; falhas nele nunca derrubam
+    a requisição (o cache apenas deixa de ajudar) e abrem um CircuitBreaker:
+    com o Redis fora, só o nível local é usado até o próximo teste.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, redis_url=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self.breaker = CircuitBreaker()
+        if redis_url:
+            try:
+                import redis
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+            except ImportError:
+                app.logger.warning("redis não instalado: cache apenas local")
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+        
+        value = None
+        if self._redis is not None and self.breaker.allow():
+            try:
+                raw = self._redis.get(f'lumora:result:{key}')
+                value = json.loads(raw) if raw else None
+                self.breaker.succeeded()
+            except Exception:
+                self.breaker.failed()
+                value = None
+        
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._store(key, value, now)
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._store(key, value, time.monotonic())
+        if self._redis is not None and self.breaker.allow():
+            try:
+                self._redis.setex(f'lumora:result:{key}', int(self.ttl), json.dumps(value))
+                self.breaker.succeeded()
+            except Exception:
+                self.breaker.failed()
+
+    def _store(self, key, value, now):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+def dhash(gray, size=8, min_texture=None, min_bits=None):
+    """Difference hash de 64 bits: gradiente horizontal de uma miniatura 9x8
+
+    Estável a re-encode, redimensionamento e recompressão JPEG. Retorna
+    None para imagens sem textura suficiente para um hash distintivo
+    (PHASH_MIN_TEXTURE, PHASH_MIN_BITS).
+    """
+    min_texture = PHASH_MIN_TEXTURE if min_texture is None else min_texture
+    min_bits = PHASH_MIN_BITS if min_bits is None else min_bits
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    ones = int(bits.sum())
+    if small.std() < min_texture or min(ones, bits.size - ones) < min_bits:
+        return None
+    return int(np.packbits(bits).view('>u8')[0])
+
+# Contagem de bits por byte (fallback de np.bitwise_count, NumPy < 2.0)
+_POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def _lock_file(f):
+    """Trava exclusiva entre processos (no Windows vale só a trava entre threads)"""
+    try:
+        import fcntl
+    except ImportError:
+        return
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+def _unlock_file(f):
+    try:
+        import fcntl
+    except ImportError:
+        return
+    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class PerceptualIndex:
+    """Índice persistente de dHash -> resultado para reaproveitar quase-duplicatas
+
+    Dois arquivos de capacidade fixa (`max_entries`) usados como anel:
+    `path` guarda um cabeçalho e registros de tamanho fixo (hash, etiqueta,
+    tamanho e posição do resultado) lidos via np.memmap; `path.data` guarda
+    os resultados (JSON comprimido) em fatias de SLOT_BYTES, uma por
+    registro. Cheio, o índice sobrescreve o registro mais antigo. A busca é
+    uma varredura vetorizada da distância de Hamming (XOR + popcount),
+    limitada pela capacidade. Gravações usam flock, então workers do
+    gunicorn compartilham os arquivos; como uma fatia pode ser sobrescrita
+    durante uma leitura, o resultado guarda o próprio hash e etiqueta e é
+    conferido ao ser lido.
+    """
+
+    RECORD = np.dtype([('hash', '<u8'), ('tag', '<u4'), ('length', '<u4'), ('offset', '<u8')])
+    # Formato do resultado guardado; entra na etiqueta. 2: só achados de
+    # pixels (o formato 1 guardava o EXIF de quem enviou a imagem original)
+    FORMAT = 2
+    # Cabeçalho (primeiro registro): hash MAGIC, tag LAYOUT, offset = total de gravações
+    MAGIC = 0x4C554D4F52414958
+    LAYOUT = 2
+    SLOT_BYTES = 2048
+
+    def __init__(self, path, max_distance=4, max_entries=50000):
+        self.path = path
+        self.data_path = path + '.data'
+        self.max_distance = max_distance
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self._records = np.zeros(1, dtype=self.RECORD)
+        self._size = 0
+        self._lock = threading.Lock()
+        for name in (self.path, self.data_path):
+            open(name, 'ab').close()
+        with open(self.path, 'r+b') as index_file:
+            _lock_file(index_file)
+            try:
+                header = np.frombuffer(index_file.read(self.RECORD.itemsize).ljust(self.RECORD.itemsize, b'\0'),
+                                       dtype=self.RECORD)[0]
+                if header['hash'] != self.MAGIC or header['tag'] != self.LAYOUT:
+                    # Arquivo novo ou do layout antigo (só crescia): recomeça vazio
+                    index_file.truncate(0)
+                    index_file.seek(0)
+                    index_file.write(np.array([(self.MAGIC, self.LAYOUT, 0, 0)], dtype=self.RECORD).tobytes())
+                    open(self.data_path, 'wb').close()
+            finally:
+                _unlock_file(index_file)
+        self._remap()
+
+    def _remap(self):
+        """Remapeia o arquivo de registros se outro processo o estendeu"""
+        size = os.path.getsize(self.path)
+        size -= size % self.RECORD.itemsize  # registro ainda sendo gravado
+        if size == self._size:
+            return
+        # Mapeamento compartilhado: sobrescritas de outros processos aparecem sem remapear
+        self._records = np.memmap(self.path, dtype=self.RECORD, mode='r',
+                                  shape=(size // self.RECORD.itemsize,))
+        self._size = size
+
+    @classmethod
+    def tag(cls, version, resolution):
+        """Versão do detector + resolução + formato: resultados de outra versão não valem"""
+        return zlib.crc32(f'{version}:{resolution}:{cls.FORMAT}'.encode())
+
+    @staticmethod
+    def _distances(hashes, hash_value):
+        diff = np.asarray(hashes, dtype=np.uint64) ^ np.uint64(hash_value)
+        if hasattr(np, 'bitwise_count'):
+            return np.bitwise_count(diff)
+        return _POPCOUNT8[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+    def _nearest(self, hash_value, tag):
+        """(registro, distância) do vizinho mais próximo com a mesma etiqueta, ou (None, 255)"""
+        records = self._records[1:self.max_entries + 1]
+        if not len(records):
+            return None, 255
+        distances = np.where(records['tag'] == tag, self._distances(records['hash'], hash_value), 255)
+        best = int(np.argmin(distances))
+        return records[best].copy(), int(distances[best])
+
+    def lookup(self, hash_value, tag):
+        """(resultado, distância) do vizinho mais próximo até max_distance, ou None"""
+        with self._lock:
+            self._remap()
+            record, distance = self._nearest(hash_value, tag)
+        if distance > self.max_distance:
+            return None
+        
+        with open(self.data_path, 'rb') as f:
+            f.seek(int(record['offset']))
+            raw = f.read(int(record['length']))
+        try:
+            entry = json.loads(zlib.decompress(raw))
+        except (zlib.error, ValueError):
+            return None  # fatia sobrescrita no meio da leitura
+        distance = int(self._distances([entry['hash']], hash_value)[0])
+        if entry['tag'] != tag or distance > self.max_distance:
+            return None  # fatia já reaproveitada por outra imagem
+        with self._lock:
+            self.hits += 1
+        return entry['content'], distance
+
+    def add(self, hash_value, tag, content):
+        """Grava um resultado na próxima posição do anel (dados antes do registro)
+
+        Não grava se já houver um vizinho até max_distance (outro worker pode
+        ter acabado de gravar a mesma imagem) nem resultados maiores que SLOT_BYTES.
+        """
+        payload = zlib.compress(json.dumps({'hash': hash_value, 'tag': tag, 'content': content},
+                                           ensure_ascii=False).encode())
+        if len(payload) > self.SLOT_BYTES:
+            return
+        with self._lock, open(self.path, 'r+b') as index_file:
+            _lock_file(index_file)
+            try:
+                self._remap()
+                if self._nearest(hash_value, tag)[1] <= self.max_distance:
+                    return
+                written = int(self._records[0]['offset'])
+                slot = written % self.max_entries
+                with open(self.data_path, 'r+b') as data_file:
+                    data_file.seek(slot * self.SLOT_BYTES)
+                    data_file.write(payload)
+                record = np.array([(hash_value, tag, len(payload), slot * self.SLOT_BYTES)], dtype=self.RECORD)
+                index_file.seek((1 + slot) * self.RECORD.itemsize)
+                index_file.write(record.tobytes())
+                header = np.array([(self.MAGIC, self.LAYOUT, 0, written + 1)], dtype=self.RECORD)
+                index_file.seek(0)
+                index_file.write(header.tobytes())
+            finally:
+                _unlock_file(index_file)
+
+    def __len__(self):
+        with self._lock:
+            self._remap()
+            return min(int(self._records[0]['offset']), self.max_entries)
+
 class AIImageDetector:
     """Detector avançado com 12+ técnicas de análise"""
     
-    def __init__(self):
+    def __init__(self, cache=None, index=None):
+        self.cache = cache
+        self.index = index
         self.weights = {
             'filename': 180, 'exif': 120, 'frequency_analysis': 100,
             'gan_artifacts': 95, 'unnatural_sharpness': 90, 'jpeg_grid': 85,
             'noise_consistency': 80, 'color_distribution': 75, 'gradient_analysis': 70,
             'chromatic_aberration': 65, 'edge_coherence': 60, 'saturation_analysis': 55
         }
+        # Ordem de execução; cada analisador recebe um FeatureContext
+        self.analyzers = [
+            ('filename', self._analyze_filename),
+            ('exif', self._analyze_exif),
+            ('frequency_analysis', self._frequency_analysis),
+            ('gan_artifacts', self._detect_gan_artifacts),
+            ('unnatural_sharpness', self._analyze_sharpness),
+            ('jpeg_grid', self._analyze_jpeg_grid),
+            ('noise_consistency', self._analyze_noise_consistency),
+            ('color_distribution', self._analyze_color_distribution),
+            ('gradient_analysis', self._analyze_gradients),
+            ('chromatic_aberration', self._analyze_chromatic_aberration),
+            ('edge_coherence', self._analyze_edge_coherence),
+            ('saturation_analysis', self._analyze_saturation)
+        ]
+        # Custo relativo (benchmark.py, imagem de 1024px): perfis com parada
+        # antecipada executam do mais barato ao mais caro. Cor e saturação dividem
+        # o ColorStats (uma passada barata); o Canny por canal é só da aberração cromática
+        self.costs = {
+            'filename': 0, 'exif': 0, 'jpeg_grid': 1, 'color_distribution': 2,
+            'saturation_analysis': 2, 'noise_consistency': 3, 'gan_artifacts': 4,
+            'frequency_analysis': 5, 'edge_coherence': 9, 'chromatic_aberration': 16,
+            'unnatural_sharpness': 17, 'gradient_analysis': 21
+        }
+        # Limiares e frações de peso de cada achado (SCORING_RULES)
+        self.scorer = RuleScorer(self.weights)
+        # Versão entra na chave do cache: mudar pesos, regras ou a amostragem de
+        # animações invalida resultados antigos
+        rules = {'weights': self.weights, 'rules': self.scorer.rules,
+                 'animation': [ANIMATION_SAMPLING, ANIMATION_FRAME_STEP, ANIMATION_SCENE_THRESHOLD,
+                               ANIMATION_MAX_FRAMES, ANIMATION_MAX_SCAN]}
+        weights_hash = hashlib.sha256(json.dumps(rules, sort_keys=True).encode()).hexdigest()[:12]
+        self.version = f'{DETECTOR_VERSION}-{weights_hash}'
     
-    def analyze_image(self, image_data, filename, file_size):
-        """Análise completa com proteções de segurança"""
-        findings = []
-        scores = {'ai': 0, 'real': 0}
-        confidence = 0
+    def analyze_image(self, image_data, filename, file_size, decoded=None, timeout=None,
+                      cache_lookup=True, profile=None, features=None, on_result=None, key=None,
+                      on_schedule=None, cancel=None):
+        """Análise completa com proteções de segurança
+
+        - decoded: imagem já decodificada por validate_image_safety
+        - timeout: segundos, sobrepõe ANALYSIS_TIMEOUT
+        - cache_lookup, key: False/chave quando o chamador já consultou o cache
+        - profile: perfil de ANALYSIS_PROFILES
+        - features: dict que recebe as medidas brutas (FEATURE_NAMES)
+        - on_result, on_schedule, cancel: ver _run_analyzers
+        """
+        profile = profile or DEFAULT_PROFILE
+        settings = ANALYSIS_PROFILES[profile]
+        timeout = ANALYSIS_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout if timeout > 0 else None
         
         try:
             # SEGURANÇA 7: Limita tamanho
             if file_size > 10 * 1024 * 1024:
                 raise ValueError("Arquivo muito grande")
             
-            # Carregar e validar imagem
-            img_array = np.frombuffer(image_data, np.uint8)
-            img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-            
-            if img is None:
-                raise ValueError("Falha ao decodificar")
+            # Nome do arquivo: decisivo e gratuito, avaliado primeiro (fora do cache)
+            name_ctx = FeatureContext(None, filename)
+            name_result = self._analyze_filename(name_ctx)
             
-            # SEGURANÇA 8: Limita dimensões
-            max_dim = 4096
-            h, w = img.shape[:2]
-            if h > max_dim or w > max_dim:
-                scale = max_dim / max(h, w)
-                new_h, new_w = int(h * scale), int(w * scale)
-                img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+            # Resultado do conteúdo já conhecido para estes bytes
+            key = key or self.cache_key(image_data, profile)
+            content = self.cache.get(key) if self.cache is not None and cache_lookup else None
+            if content is not None:
+                return self._summarize(name_result, content['analyses'], content['exif'], [], profile,
+                                       content.get('tiles'), content.get('frames'), content.get('early'))
             
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            exif_data = self._extract_exif(image_data)
+            # Carregar e validar imagem (decodificação única)
+            if decoded is None:
+                decoded = decode_image(image_data, settings['max_dim'])
+            img = decoded.pixels
+            if METRICS_ENABLED:
+                metrics.image_megapixels.observe(decoded.width * decoded.height / 1e6)
+                metrics.image_bytes.observe(file_size)
             
-            # Executar todas as análises
-            analyses = [
-                self._analyze_filename(filename),
-                self._analyze_exif(exif_data),
-                self._frequency_analysis(img),
-                self._detect_gan_artifacts(img),
-                self._analyze_sharpness(img),
-                self._analyze_jpeg_grid(img),
-                self._analyze_noise_consistency(img),
-                self._analyze_color_distribution(img_rgb),
-                self._analyze_gradients(img),
-                self._analyze_chromatic_aberration(img),
-                self._analyze_edge_coherence(img),
-                self._analyze_saturation(img_rgb)
-            ]
+            img = self._limit_size(img, settings['max_dim'])
+            exif_data = decoded.exif
             
-            # Processar resultados
-            for result in analyses:
-                if result:
-                    findings.append(result)
-                    scores[result['impact']] += result['weight']
-                    confidence += result.get('confidence_boost', 15)
+            # Executar as análises de conteúdo (intermediários compartilhados via contexto)
+            analyzers = [(name, analyzer) for name, analyzer in self.analyzers if name != 'filename']
+            if settings['early_exit']:
+                analyzers.sort(key=lambda item: self.costs[item[0]])
+            tiles = frames = hash_value = None
+            early = []
+            if settings.get('tile'):
+                analyses, skipped, tiles = self._run_tiled(img, filename, exif_data, analyzers,
+                                                           settings['tile'], deadline, cancel)
+            elif decoded.animated and ANIMATION_SAMPLING != 'first':
+                analyses, skipped, frames = self._run_frames(decoded.data, filename, exif_data, analyzers,
+                                                             settings['max_dim'], deadline, cancel)
+            else:
+                ctx = FeatureContext(img, filename, exif_data, [analyzer for _, analyzer in analyzers])
+                # Quase-duplicata (re-encode, resize) de uma imagem já analisada; o
+                # cinza é o mesmo que os analisadores usam. O perfil tiled procura
+                # diferenças locais e sempre analisa
+                if self.index is not None:
+                    with timed('dhash'):
+                        hash_value = dhash(ctx.get('gray'))
+                if hash_value is not None:
+                    tag = PerceptualIndex.tag(self.version, key.rsplit(':', 1)[1])
+                    match = self.index.lookup(hash_value, tag)
+                    if match is not None:
+                        # Do índice vêm só os achados de pixels; EXIF e nome são sempre deste envio
+                        content, distance = match
+                        found = dict(content['pixel'], exif=self._analyze_exif(ctx))
+                        analyses = [found[name] for name, _ in self.analyzers if name in found]
+                        result = self._summarize(name_result, analyses, self._sanitize_exif(exif_data), [], profile,
+                                                 early=content.get('early'))
+                        result['nearDuplicate'] = {'distance': distance}
+                        return result
+                scores = self._score([name_result]) if settings['early_exit'] else None
+                if on_schedule is not None:
+                    on_schedule([name for name, _ in analyzers])
+                analyses, skipped, early = self._run_analyzers(ctx, analyzers, deadline, scores, on_result,
+                                                               cancel)
+                if on_schedule is not None and (skipped or early):
+                    on_schedule([name for name, _ in analyzers if name in analyses])
+                if features is not None:
+                    features.update(name_ctx.features)
+                    features.update(ctx.features)
             
-            # Calcular resultado final
-            total = scores['ai'] + scores['real']
-            ai_probability = (scores['ai'] / total * 100) if total > 0 else 50
-            confidence = min(100, confidence)
+            # Só resultados completos entram no cache; parada antecipada conta como
+            # completa (a chave separa perfis com e sem ela), prazo ou cancelamento não
+            content = {'analyses': list(analyses.values()), 'exif': self._sanitize_exif(exif_data)}
+            if tiles is not None:
+                content['tiles'] = tiles
+            if frames is not None:
+                content['frames'] = frames
+            if early:
+                content['early'] = early
+            if self.cache is not None and not skipped:
+                self.cache.set(key, content)
+            if hash_value is not None and not skipped:
+                pixel = {name: analyses[name] for name, analyzer in analyzers
+                         if getattr(analyzer, 'requires', ()) and name in analyses}
+                self.index.add(hash_value, tag, {'pixel': pixel, 'early': early})
             
-            return {
-                'findings': findings,
-                'scores': scores,
-                'confidence': confidence,
-                'aiProbability': ai_probability,
-                'exif': self._sanitize_exif(exif_data)
-            }
+            return self._summarize(name_result, content['analyses'], content['exif'], skipped, profile,
+                                   tiles, frames, early)
             
         except Exception as e:
             # SEGURANÇA 9: Não vazar informações do sistema
@@ -187,9 +1783,376 @@ class AIImageDetector:
                 'scores': {'ai': 0, 'real': 0},
                 'confidence': 0,
                 'aiProbability': 50,
-                'exif': {}
+                'exif': {},
+                'profile': profile,
+                'skipped': [],
+                'earlyExit': []
             }
     
+    def extract_features(self, image_data, filename, decoded=None, profile=None):
+        """Etapa de extração: vetor float de len(FEATURE_NAMES) para uma imagem
+
+        Roda todos os analisadores (sem parada antecipada nem cache) e devolve
+        só as medidas; a etapa de pontuação é self.scorer.score, que aceita
+        uma matriz com os vetores de muitas imagens.
+        """
+        settings = ANALYSIS_PROFILES[profile or DEFAULT_PROFILE]
+        if decoded is None:
+            decoded = decode_image(image_data, settings['max_dim'])
+        img = self._limit_size(decoded.pixels, settings['max_dim'])
+        ctx = FeatureContext(img, filename, decoded.exif, [analyzer for _, analyzer in self.analyzers])
+        self._run_analyzers(ctx, self.analyzers)
+        return feature_vector(ctx.features)
+    
+    def _limit_size(self, img, max_dim):
+        """SEGURANÇA 8: Limita dimensões (o perfil fast usa um proxy reduzido;
+        o tiled mantém a resolução original, já limitada por MAX_PIXELS)"""
+        h, w = img.shape[:2]
+        if max_dim and (h > max_dim or w > max_dim):
+            scale = max_dim / max(h, w)
+            new_h, new_w = int(h * scale), int(w * scale)
+            with timed('resize'):
+                img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        return img
+    
+    def cache_key(self, image_data, profile=None):
+        """Chave de conteúdo: SHA-256 dos bytes + versão do detector/pesos + resolução
+
+        A parte da resolução marca também a parada antecipada: standard e full
+        têm o mesmo max_dim, mas um resultado antecipado não serve ao full.
+        """
+        settings = ANALYSIS_PROFILES[profile or DEFAULT_PROFILE]
+        resolution = f"tile{settings['tile']}" if settings.get('tile') else settings['max_dim']
+        if settings['early_exit']:
+            resolution = f'{resolution}-early'
+        return f'{hashlib.sha256(image_data).hexdigest()}:{self.version}:{resolution}'
+    
+    def cached_result(self, image_data, filename, profile=None, key=None):
+        """Resultado completo vindo do cache, ou None se estes bytes são inéditos"""
+        if self.cache is None:
+            return None
+        content = self.cache.get(key or self.cache_key(image_data, profile))
+        if content is None:
+            return None
+        return self._summarize(self.filename_result(filename), content['analyses'], content['exif'], [],
+                               profile or DEFAULT_PROFILE, content.get('tiles'), content.get('frames'),
+                               content.get('early'))
+    
+    def filename_result(self, filename):
+        """Veredito só do nome do arquivo (não depende dos bytes)"""
+        return self._analyze_filename(FeatureContext(None, filename))
+    
+    def _score(self, analyses):
+        """Placar ai/real de uma lista de resultados"""
+        scores = {'ai': 0, 'real': 0}
+        for result in analyses:
+            if result:
+                scores[result['impact']] += result['weight']
+        return scores
+    
+    def _summarize(self, name_result, analyses, exif, skipped, profile, tiles=None, frames=None, early=None):
+        """Combina o veredito do nome do arquivo com as análises de conteúdo"""
+        findings = []
+        confidence = 0
+        analyses = [name_result] + list(analyses)
+        
+        # Processar resultados
+        for result in analyses:
+            if result:
+                findings.append(result)
+                confidence += result.get('confidence_boost', 15)
+        scores = self._score(analyses)
+        
+        # Calcular resultado final
+        total = scores['ai'] + scores['real']
+        ai_probability = (scores['ai'] / total * 100) if total > 0 else 50
+        confidence = min(100, confidence)
+        
+        summary = {
+            'findings': findings,
+            'scores': scores,
+            'confidence': confidence,
+            'aiProbability': ai_probability,
+            'exif': exif,
+            'profile': profile,
+            'skipped': skipped,
+            'earlyExit': early or []
+        }
+        if tiles is not None:
+            summary['tiles'] = tiles
+        if frames is not None:
+            summary['frames'] = frames
+        return summary
+    
+    def _run_tiled(self, img, filename, exif, analyzers, tile_size, deadline=None, cancel=None):
+        """Analisa a imagem em blocos de até tile_size px, um bloco por vez
+
+        Metadados rodam uma vez; os analisadores de pixels rodam em cada bloco
+        com um FeatureContext próprio, então os intermediários nunca passam
+        do tamanho de um bloco. Cada analisador vira um veredito global por
+        maioria entre os blocos. Retorna (resultados, ignorados, tiles), com
+        `tiles` trazendo a grade de aiProbability por bloco e as bordas dos
+        blocos (ys, xs) em pixels da imagem.
+
+        Só os intermediários são limitados pelo bloco: `img` é a imagem
+        inteira já decodificada (até MAX_PIXELS, ~150 MB em BGR), porque o
+        Pillow e o OpenCV decodificam o quadro todo antes de qualquer recorte.
+        O pico de memória do perfil é essa decodificação mais um bloco.
+        """
+        metadata = [item for item in analyzers if not getattr(item[1], 'requires', ())]
+        pixel = [item for item in analyzers if getattr(item[1], 'requires', ())]
+        results, skipped, _ = self._run_analyzers(FeatureContext(img, filename, exif), metadata, deadline,
+                                                  cancel=cancel)
+        
+        h, w = img.shape[:2]
+        ny, nx = -(-h // tile_size), -(-w // tile_size)
+        ys = np.linspace(0, h, ny + 1).astype(int)
+        xs = np.linspace(0, w, nx + 1).astype(int)
+        votes = {name: [] for name, _ in pixel}
+        grid = [[None] * nx for _ in range(ny)]
+        analyzed = 0
+        for row in range(ny):
+            for col in range(nx):
+                if deadline_passed(deadline, cancel):
+                    break
+                tile = img[ys[row]:ys[row + 1], xs[col]:xs[col + 1]]
+                grid[row][col] = self._vote_region(tile, filename, exif, pixel, votes, deadline, cancel)
+                if grid[row][col] is None:
+                    break
+                analyzed += 1
+        
+        if analyzed < ny * nx:
+            # Prazo estourado ou cancelado: blocos restantes não entram no veredito
+            skipped = skipped + [name for name, _ in pixel]
+        else:
+            results = self._merge_votes(results, pixel, votes, analyzed)
+        
+        probabilities = [p for line in grid for p in line if p is not None]
+        if probabilities and max(probabilities) >= TILE_OUTLIER_PROBABILITY \
+                and min(probabilities) <= 100 - TILE_OUTLIER_PROBABILITY:
+            outliers = sum(p >= TILE_OUTLIER_PROBABILITY for p in probabilities)
+            # Informativo (peso 0): aponta regiões para inspeção, sem mexer no placar
+            results['tile_outliers'] = {
+                'type': 'warning', 'icon': '🧩', 'title': 'Regiões divergentes',
+                'explain': f'{outliers} de {len(probabilities)} regiões parecem geradas por IA e outras não. '
+                           'Pode indicar edição parcial (inpainting).',
+                'impact': 'ai', 'weight': 0, 'confidence_boost': 0
+            }
+        
+        # Blocos divididos por igual (até tile_size px): bordas reais em pixels,
+        # a linha/coluna i vai de ys[i]/xs[i] a ys[i + 1]/xs[i + 1]
+        tiles = {'rows': ny, 'cols': nx, 'ys': ys.tolist(), 'xs': xs.tolist(), 'aiProbability': grid}
+        return results, skipped, tiles
+    
+    def _run_frames(self, data, filename, exif, analyzers, max_dim, deadline=None, cancel=None):
+        """Analisa os quadros amostrados de uma animação, um quadro por vez
+
+        Mesmo esquema de _run_tiled: metadados uma vez, analisadores de pixels
+        por quadro (FeatureContext próprio) e veredito por maioria. Retorna
+        (resultados, ignorados, frames), com a aiProbability de cada quadro.
+        """
+        metadata = [item for item in analyzers if not getattr(item[1], 'requires', ())]
+        pixel = [item for item in analyzers if getattr(item[1], 'requires', ())]
+        results, skipped, _ = self._run_analyzers(FeatureContext(None, filename, exif), metadata, deadline,
+                                                  cancel=cancel)
+        
+        votes = {name: [] for name, _ in pixel}
+        sampled, probabilities = [], []
+        sampler = FrameSampler(data)
+        complete = True
+        stream = iter(sampler)
+        try:
+            for index, frame in stream:
+                if deadline_passed(deadline, cancel):
+                    complete = False
+                    break
+                probability = self._vote_region(self._limit_size(frame, max_dim), filename, exif, pixel,
+                                                votes, deadline, cancel)
+                # Solta o quadro antes de decodificar o próximo
+                del frame
+                if probability is None:
+                    complete = False
+                    break
+                sampled.append(index)
+                probabilities.append(probability)
+        finally:
+            stream.close()
+        
+        if not complete or not sampled:
+            # Prazo estourado ou cancelado: quadros restantes não entram no veredito
+            skipped = skipped + [name for name, _ in pixel]
+        else:
+            results = self._merge_votes(results, pixel, votes, len(sampled), 'quadros')
+        
+        frames = {'policy': sampler.policy, 'scanned': sampler.scanned, 'sampled': sampled,
+                  'aiProbability': probabilities}
+        return results, skipped, frames
+    
+    def _vote_region(self, img, filename, exif, pixel, votes, deadline=None, cancel=None):
+        """Roda os analisadores de pixels em um bloco ou quadro
+
+        Acrescenta os achados em `votes` e devolve a aiProbability da região,
+        ou None se o prazo estourou antes de todos terminarem.
+        """
+        ctx = FeatureContext(img, filename, exif, [analyzer for _, analyzer in pixel])
+        region_results, region_skipped, _ = self._run_analyzers(ctx, pixel, deadline, cancel=cancel)
+        if region_skipped:
+            return None
+        for name, result in region_results.items():
+            if result:
+                votes[name].append(result)
+        scores = self._score(region_results.values())
+        total = scores['ai'] + scores['real']
+        return round(scores['ai'] / total * 100, 1) if total else 50.0
+    
+    def _merge_votes(self, results, pixel, votes, regions, noun='regiões'):
+        """Veredito por maioria de cada analisador de pixels, na ordem de self.analyzers"""
+        for name, _ in pixel:
+            results[name] = self._majority(votes[name], regions, noun)
+        return {name: results[name] for name, _ in self.analyzers if name in results}
+    
+    def _majority(self, votes, regions, noun='regiões'):
+        """Veredito global de um analisador: o lado que vence em pelo menos metade das regiões"""
+        ai = [result for result in votes if result['impact'] == 'ai']
+        real = [result for result in votes if result['impact'] == 'real']
+        majority = ai if len(ai) > len(real) else real
+        if len(ai) == len(real) or len(majority) * 2 < regions:
+            return None
+        finding = dict(majority[0])
+        if regions > 1:
+            finding['explain'] = f"{finding['explain']} ({len(majority)} de {regions} {noun})"
+        return finding
+    
+    def _run_analyzers(self, ctx, analyzers, deadline=None, scores=None, on_result=None, cancel=None):
+        """Executa os analisadores em série ou no pool compartilhado
+
+        Retorna ({nome: resultado} na ordem de self.analyzers, ignorados,
+        antecipados). Analisadores que não terminam até `deadline` são
+        descartados do placar (ignorados). Com `scores` (placar parcial), a
+        execução para assim que a margem ai/real supera o peso máximo dos
+        analisadores pendentes; estes são os antecipados.
+        `on_result(nome, achado)` recebe cada resultado na ordem em que
+        terminam (achado None = sem veredito). `cancel` (threading.Event) vale
+        como um prazo que estoura quando sinalizado. Em analyze_image, que só
+        os repassa fora do cache, do perfil tiled e de animações,
+        `on_schedule(nomes)` recebe os agendados antes da execução e de novo
+        só os que terminaram se algum ficou de fora.
+        """
+        def run(name, analyzer):
+            try:
+                with timed(name):
+                    return analyzer(ctx)
+            finally:
+                ctx.done(analyzer)
+        
+        results = {}
+        
+        def record(name, result):
+            results[name] = result
+            if on_result is not None:
+                on_result(name, result)
+            if scores is not None and result:
+                scores[result['impact']] += result['weight']
+        
+        def decided(pending):
+            # O veredito não vira mais: nem todos os pendentes juntos alcançam a margem
+            if scores is None:
+                return False
+            return abs(scores['ai'] - scores['real']) > sum(self.weights[name] for name in pending)
+        
+        def expired():
+            return deadline_passed(deadline, cancel)
+        
+        def collect(future):
+            if ANALYSIS_EXECUTOR != 'process':
+                return [(futures[future][0], future.result())]
+            # Medidas e tempos voltam do worker junto com os achados do grupo
+            results, features = future.result()
+            ctx.features.update(features)
+            for name, _, elapsed in results:
+                record_stage(name, elapsed)
+            return [(name, result) for name, result, _ in results]
+        
+        # Metadados (sem intermediários de pixels) rodam na hora, antes do pool
+        if ANALYSIS_EXECUTOR in ('thread', 'process'):
+            inline = [item for item in analyzers if not getattr(item[1], 'requires', ())]
+            pooled = [item for item in analyzers if getattr(item[1], 'requires', ())]
+        else:
+            inline, pooled = analyzers, []
+        
+        pending = [name for name, _ in analyzers]
+        for name, analyzer in inline:
+            if decided(pending) or expired():
+                break
+            record(name, run(name, analyzer))
+            pending.remove(name)
+        else:
+            if pooled and not decided(pending):
+                shared = []
+                futures, not_done = {}, set()
+                try:
+                    if ANALYSIS_EXECUTOR == 'process':
+                        # Uma tarefa por conjunto de produtos pedidos: quem pede os mesmos
+                        # intermediários roda junto e os calcula uma vez no worker
+                        groups = {}
+                        for name, analyzer in pooled:
+                            groups.setdefault(analyzer.requires, []).append(name)
+                        # Produtos de mais de um grupo (ex.: cinza) são calculados uma vez aqui.
+                        # Pixels e produtos vão para a memória compartilhada; só os nomes vão no pickle
+                        uses = {}
+                        for products in groups:
+                            for product in ctx._expand(products):
+                                uses[product] = uses.get(product, 0) + 1
+                        shared.append((None, SharedImage(ctx.img)))
+                        for product, count in uses.items():
+                            value = ctx.get(product) if count > 1 else None
+                            if isinstance(value, np.ndarray):
+                                shared.append((product, SharedImage(value)))
+                        segments = [(product, image.name, image.shape, image.dtype) for product, image in shared]
+                        pool = get_process_pool()
+                        for names in groups.values():
+                            futures[pool.submit(_run_shared_analyzers, segments, ctx.filename, ctx.exif,
+                                                names)] = names
+                    else:
+                        # copy_context leva o Server-Timing da requisição para as threads do pool
+                        pool = get_analysis_pool()
+                        for name, analyzer in pooled:
+                            futures[pool.submit(contextvars.copy_context().run, run, name, analyzer)] = [name]
+                    not_done = set(futures)
+                    while not_done:
+                        remaining = None if deadline is None else max(0, deadline - time.monotonic())
+                        if cancel is not None:
+                            remaining = min(remaining if remaining is not None else CANCEL_POLL_INTERVAL,
+                                            CANCEL_POLL_INTERVAL)
+                        done, not_done = wait(not_done, timeout=remaining, return_when=FIRST_COMPLETED)
+                        if not done and expired():
+                            break
+                        for future in done:
+                            for name, result in collect(future):
+                                record(name, result)
+                                pending.remove(name)
+                        if decided(pending):
+                            break
+                except BrokenExecutor:
+                    # Um worker morreu (OOM, sinal): esta análise falha, a próxima ganha um pool novo
+                    if ANALYSIS_EXECUTOR == 'process':
+                        discard_process_pool(pool)
+                    raise
+                finally:
+                    # Libera a fila do pool; o que já está rodando termina em segundo plano
+                    for future in futures:
+                        future.cancel()
+                    for _, image in shared:
+                        image.close()
+        
+        ordered = {name: results[name] for name, _ in self.analyzers if name in results}
+        missing = [name for name, _ in self.analyzers if name in pending]
+        # Pendentes com o veredito já decidido ficaram de fora pela parada
+        # antecipada (resultado completo); senão, pelo prazo ou `cancel`
+        if missing and decided(pending):
+            return ordered, [], missing
+        return ordered, missing, []
+    
     def _sanitize_exif(self, exif_data):
         """SEGURANÇA 10: Remove dados sensíveis do EXIF"""
         if not exif_data:
@@ -208,297 +2171,272 @@ class AIImageDetector:
         
         return sanitized
     
-    def _extract_exif(self, image_data):
-        """Extrair metadados EXIF"""
-        try:
-            img = Image.open(io.BytesIO(image_data))
-            exif_data = {}
-            if hasattr(img, '_getexif') and img._getexif():
-                exif = img._getexif()
-                for tag_id, value in exif.items():
-                    tag = ExifTags.TAGS.get(tag_id, tag_id)
-                    exif_data[tag] = str(value)
-            return exif_data
-        except:
-            return {}
-    
-    def _analyze_filename(self, filename):
+    def _analyze_filename(self, ctx):
         """Análise crítica do nome do arquivo"""
-        fn = filename.lower()
+        fn = ctx.filename.lower()
         critical = ['chatgpt', 'gpt', 'dalle', 'dall-e', 'midjourney', 'stablediffusion', 
                    'stable-diffusion', 'leonardo', 'firefly']
         
-        for keyword in critical:
-            if keyword in fn:
-                return {
-                    'type': 'critical', 'icon': '🚨',
-                    'title': f'Nome contém "{keyword.upper()}"',
-                    'explain': 'Nome indica claramente origem de IA. Geradores adicionam suas marcas.',
-                    'impact': 'ai', 'weight': self.weights['filename'], 'confidence_boost': 30
-                }
+        keyword = next((keyword for keyword in critical if keyword in fn), None)
         
         patterns = [(r'_ai_', 'AI'), (r'generated', 'Generated'), (r'output_\d+', 'Output')]
-        for pattern, desc in patterns:
-            if re.search(pattern, fn):
-                return {
-                    'type': 'high', 'icon': '⚠️', 'title': f'Padrão "{desc}" detectado',
-                    'explain': 'Nomenclatura típica de geração automatizada.',
-                    'impact': 'ai', 'weight': int(self.weights['filename'] * 0.6), 'confidence_boost': 20
-                }
+        desc = next((desc for pattern, desc in patterns if re.search(pattern, fn)), None)
+        ctx.record(filename_keyword=keyword is not None, filename_pattern=desc is not None)
+        
+        rule = self.scorer.match('filename', ctx.features)
+        if rule == 0:
+            return {
+                'type': 'critical', 'icon': '🚨',
+                'title': f'Nome contém "{keyword.upper()}"',
+                'explain': 'Nome indica claramente origem de IA. Geradores adicionam suas marcas.',
+                'impact': 'ai', 'weight': self.scorer.weight('filename', rule), 'confidence_boost': 30
+            }
+        elif rule == 1:
+            return {
+                'type': 'high', 'icon': '⚠️', 'title': f'Padrão "{desc}" detectado',
+                'explain': 'Nomenclatura típica de geração automatizada.',
+                'impact': 'ai', 'weight': self.scorer.weight('filename', rule), 'confidence_boost': 20
+            }
         return None
     
-    def _analyze_exif(self, exif_data):
+    def _analyze_exif(self, ctx):
         """Análise de metadados EXIF"""
-        if not exif_data:
+        exif_data = ctx.exif
+        has_camera = 'Make' in exif_data or 'Model' in exif_data
+        has_exposure = any(k in exif_data for k in ['ExposureTime', 'FNumber', 'ISOSpeedRatings', 'ISO'])
+        ctx.record(exif_tags=len(exif_data), exif_camera=has_camera, exif_exposure=has_exposure)
+        
+        rule = self.scorer.match('exif', ctx.features)
+        if rule == 0:
             return {
                 'type': 'warning', 'icon': '⚠️', 'title': 'Sem metadados EXIF',
                 'explain': 'IA geralmente não possui dados de câmera.',
-                'impact': 'ai', 'weight': int(self.weights['exif'] * 0.4), 'confidence_boost': 15
+                'impact': 'ai', 'weight': self.scorer.weight('exif', rule), 'confidence_boost': 15
             }
-        
-        has_camera = 'Make' in exif_data or 'Model' in exif_data
-        has_exposure = any(k in exif_data for k in ['ExposureTime', 'FNumber', 'ISOSpeedRatings', 'ISO'])
-        
-        if has_camera and has_exposure:
+        elif rule == 1:
             camera = f"{exif_data.get('Make', '')} {exif_data.get('Model', '')}".strip()
             return {
                 'type': 'good', 'icon': '📸', 'title': 'Metadados de câmera genuínos',
                 'explain': f'Dados de câmera real: {camera}',
-                'impact': 'real', 'weight': self.weights['exif'], 'confidence_boost': 25
+                'impact': 'real', 'weight': self.scorer.weight('exif', rule), 'confidence_boost': 25
             }
         return None
     
-    def _frequency_analysis(self, img):
+    @requires('gray')
+    def _frequency_analysis(self, ctx):
         """Análise de frequência DFT"""
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        gray = ctx.get('gray')
         if max(gray.shape) > 512:
             scale = 512 / max(gray.shape)
             gray = cv2.resize(gray, None, fx=scale, fy=scale)
         
-        dft = cv2.dft(np.float32(gray), flags=cv2.DFT_COMPLEX_OUTPUT)
-        dft_shift = np.fft.fftshift(dft)
-        magnitude = np.log(cv2.magnitude(dft_shift[:,:,0], dft_shift[:,:,1]) + 1)
-        
-        center_h, center_w = magnitude.shape[0] // 2, magnitude.shape[1] // 2
-        low_freq = magnitude[center_h-30:center_h+30, center_w-30:center_w+30]
-        high_freq = np.concatenate([magnitude[0:30, :], magnitude[-30:, :]])
+        ratio, profile = spectral_features(gray)
+        slope, hf_excess = radial_profile_fit(profile)
+        ctx.record(frequency_ratio=ratio, spectral_slope=slope, spectral_hf_excess=hf_excess)
         
-        ratio = np.mean(low_freq) / (np.mean(high_freq) + 1e-10)
-        
-        if ratio > 15:
+        rule = self.scorer.match('frequency_analysis', ctx.features)
+        if rule == 0:
             return {
                 'type': 'high', 'icon': '📊', 'title': 'Espectro artificial',
                 'explain': f'Excesso de baixas frequências (ratio: {ratio:.1f}). IA é artificialmente lisa.',
-                'impact': 'ai', 'weight': self.weights['frequency_analysis'], 'confidence_boost': 25
+                'impact': 'ai', 'weight': self.scorer.weight('frequency_analysis', rule), 'confidence_boost': 25
             }
-        elif ratio < 5:
+        elif rule == 1:
             return {
                 'type': 'good', 'icon': '📈', 'title': 'Distribuição natural de frequências',
                 'explain': f'Equilíbrio natural (ratio: {ratio:.1f}). Típico de fotos reais.',
-                'impact': 'real', 'weight': int(self.weights['frequency_analysis'] * 0.85), 'confidence_boost': 25
+                'impact': 'real', 'weight': self.scorer.weight('frequency_analysis', rule), 'confidence_boost': 25
             }
         return None
     
-    def _detect_gan_artifacts(self, img):
+    @requires('gray')
+    def _detect_gan_artifacts(self, ctx):
         """Detectar artefatos de GANs"""
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        block_size = 16
-        h, w = gray.shape
-        
-        block_vars = []
-        for y in range(0, h - block_size, block_size):
-            for x in range(0, w - block_size, block_size):
-                block = gray[y:y+block_size, x:x+block_size]
-                block_vars.append(np.var(block))
+        gray = ctx.get('gray')
+        _, block_vars = block_stats(gray, 16)
         
-        if not block_vars:
+        if block_vars.size == 0:
             return None
         
         var_of_vars = np.var(block_vars)
         mean_var = np.mean(block_vars)
+        ctx.record(gan_var_of_vars=var_of_vars, gan_mean_var=mean_var)
         
-        if var_of_vars < 500 and mean_var < 100:
+        rule = self.scorer.match('gan_artifacts', ctx.features)
+        if rule == 0:
             return {
                 'type': 'high', 'icon': '🤖', 'title': 'Artefatos GAN',
                 'explain': 'Blocos uniformes típicos de redes neurais. Forte indicador de IA.',
-                'impact': 'ai', 'weight': self.weights['gan_artifacts'], 'confidence_boost': 25
+                'impact': 'ai', 'weight': self.scorer.weight('gan_artifacts', rule), 'confidence_boost': 25
             }
-        elif var_of_vars > 2000:
+        elif rule == 1:
             return {
                 'type': 'good', 'icon': '✓', 'title': 'Variação natural',
                 'explain': 'Distribuição irregular típica de fotos reais.',
-                'impact': 'real', 'weight': int(self.weights['gan_artifacts'] * 0.75), 'confidence_boost': 20
+                'impact': 'real', 'weight': self.scorer.weight('gan_artifacts', rule), 'confidence_boost': 20
             }
         return None
     
-    def _analyze_sharpness(self, img):
+    @requires('laplacian')
+    def _analyze_sharpness(self, ctx):
         """Nitidez artificial vs natural"""
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-        sharpness = laplacian.var()
+        laplacian = ctx.get('laplacian')
+        # meanStdDev acumula em double sem criar cópias float64 da imagem
+        sharpness = cv2.meanStdDev(laplacian)[1][0, 0] ** 2
         
-        lap_hist, _ = np.histogram(laplacian.flatten(), bins=50)
-        lap_entropy = stats.entropy(lap_hist + 1)
+        lap_hist, _ = np.histogram(laplacian.ravel(), bins=50)
+        lap_entropy = histogram_entropy(lap_hist + 1)
+        ctx.record(sharpness=sharpness, laplacian_entropy=lap_entropy)
         
-        if sharpness > 1500 and lap_entropy < 2.5:
+        rule = self.scorer.match('unnatural_sharpness', ctx.features)
+        if rule == 0:
             return {
                 'type': 'high', 'icon': '🔍', 'title': 'Nitidez artificial',
                 'explain': 'Nitidez muito uniforme. Câmeras reais têm variação focal.',
-                'impact': 'ai', 'weight': self.weights['unnatural_sharpness'], 'confidence_boost': 20
+                'impact': 'ai', 'weight': self.scorer.weight('unnatural_sharpness', rule), 'confidence_boost': 20
             }
-        elif 200 < sharpness < 800 and lap_entropy > 3.0:
+        elif rule == 1:
             return {
                 'type': 'good', 'icon': '🎯', 'title': 'Nitidez natural',
                 'explain': 'Variação natural de foco típica de câmeras.',
-                'impact': 'real', 'weight': int(self.weights['unnatural_sharpness'] * 0.7), 'confidence_boost': 20
+                'impact': 'real', 'weight': self.scorer.weight('unnatural_sharpness', rule), 'confidence_boost': 20
             }
         return None
     
-    def _analyze_jpeg_grid(self, img):
+    @requires('gray')
+    def _analyze_jpeg_grid(self, ctx):
         """Padrões de grade JPEG"""
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        h, w = gray.shape
+        gray = ctx.get('gray')
         
-        block_edges = []
-        for y in range(8, h-8, 8):
-            diff = np.abs(gray[y, :].astype(float) - gray[y-1, :].astype(float))
-            block_edges.append(np.mean(diff))
+        # Fronteiras 8x8 nas linhas (critério do veredito) e nas colunas
+        avg_edge, col_edge = block_boundary_diffs(gray, 8)
         
-        if not block_edges:
+        if avg_edge is None:
             return None
+        ctx.record(jpeg_grid_rows=avg_edge, jpeg_grid_cols=col_edge if col_edge is not None else np.nan)
+        grid = f'horizontal: {avg_edge:.1f}' + (f', vertical: {col_edge:.1f}' if col_edge is not None else '')
         
-        avg_edge = np.mean(block_edges)
-        
-        if avg_edge > 3.0:
+        rule = self.scorer.match('jpeg_grid', ctx.features)
+        if rule == 0:
             return {
                 'type': 'good', 'icon': '🔲', 'title': 'Artefatos JPEG',
-                'explain': 'Grade 8x8 de compressão JPEG. Típico de fotos reais.',
-                'impact': 'real', 'weight': int(self.weights['jpeg_grid'] * 0.8), 'confidence_boost': 20
+                'explain': f'Grade 8x8 de compressão JPEG ({grid}). Típico de fotos reais.',
+                'impact': 'real', 'weight': self.scorer.weight('jpeg_grid', rule), 'confidence_boost': 20
             }
-        elif avg_edge < 0.5:
+        elif rule == 1:
             return {
                 'type': 'warning', 'icon': '⚡', 'title': 'Sem artefatos JPEG',
-                'explain': 'Falta de compressão JPEG pode indicar IA.',
-                'impact': 'ai', 'weight': int(self.weights['jpeg_grid'] * 0.6), 'confidence_boost': 15
+                'explain': f'Falta de compressão JPEG ({grid}) pode indicar IA.',
+                'impact': 'ai', 'weight': self.scorer.weight('jpeg_grid', rule), 'confidence_boost': 15
             }
         return None
     
-    def _analyze_noise_consistency(self, img):
+    @requires('gray')
+    def _analyze_noise_consistency(self, ctx):
         """Consistência de ruído"""
-        h, w = img.shape[:2]
-        regions = [img[0:h//2, 0:w//2], img[0:h//2, w//2:w], 
-                  img[h//2:h, 0:w//2], img[h//2:h, w//2:w]]
+        gray = ctx.get('gray')
+        h, w = gray.shape[:2]
+        regions = [gray[0:h//2, 0:w//2], gray[0:h//2, w//2:w], 
+                  gray[h//2:h, 0:w//2], gray[h//2:h, w//2:w]]
         
-        noise_levels = []
-        for region in regions:
-            gray = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY)
-            noise = cv2.Laplacian(gray, cv2.CV_64F).std()
-            noise_levels.append(noise)
+        # Laplaciano de cada quadrante (não recorte do da imagem inteira: nas
+        # bordas entre quadrantes o valor mudaria); int16 é exato
+        noise_levels = [cv2.meanStdDev(cv2.Laplacian(region, cv2.CV_16S))[1][0, 0] for region in regions]
         
         noise_std = np.std(noise_levels)
         noise_mean = np.mean(noise_levels)
+        ctx.record(noise_std=noise_std, noise_mean=noise_mean)
         
-        if noise_std < 1.0 and noise_mean < 5.0:
+        rule = self.scorer.match('noise_consistency', ctx.features)
+        if rule == 0:
             return {
                 'type': 'high', 'icon': '🎭', 'title': 'Ruído artificial uniforme',
                 'explain': 'Ruído muito consistente. IA gera ruído sintético.',
-                'impact': 'ai', 'weight': self.weights['noise_consistency'], 'confidence_boost': 20
+                'impact': 'ai', 'weight': self.scorer.weight('noise_consistency', rule), 'confidence_boost': 20
             }
-        elif noise_std > 3.0 and noise_mean > 8.0:
+        elif rule == 1:
             return {
                 'type': 'good', 'icon': '📷', 'title': 'Ruído natural de sensor',
                 'explain': 'Variação típica de sensores reais.',
-                'impact': 'real', 'weight': int(self.weights['noise_consistency'] * 0.8), 'confidence_boost': 20
+                'impact': 'real', 'weight': self.scorer.weight('noise_consistency', rule), 'confidence_boost': 20
             }
         return None
     
-    def _analyze_color_distribution(self, img_rgb):
+    @requires('color_stats')
+    def _analyze_color_distribution(self, ctx):
         """Distribuição e correlação de cores"""
-        # Amostragem para performance
-        h, w = img_rgb.shape[:2]
-        sample_size = min(10000, h * w)
-        indices = np.random.choice(h * w, sample_size, replace=False)
-        
-        r_flat = img_rgb[:,:,0].flatten()[indices]
-        g_flat = img_rgb[:,:,1].flatten()[indices]
-        b_flat = img_rgb[:,:,2].flatten()[indices]
-        
-        corr_rg = np.corrcoef(r_flat, g_flat)[0, 1]
-        corr_rb = np.corrcoef(r_flat, b_flat)[0, 1]
-        corr_gb = np.corrcoef(g_flat, b_flat)[0, 1]
+        color = ctx.get('color_stats')
+        # Amostragem determinística (passo fixo) para performance e cache estável
+        corr = color.correlation
+        corr_rg, corr_rb, corr_gb = corr[2, 1], corr[2, 0], corr[1, 0]
         avg_corr = (corr_rg + corr_rb + corr_gb) / 3
         
-        hist_r = cv2.calcHist([img_rgb], [0], None, [256], [0, 256])
-        entropy_r = stats.entropy(hist_r.flatten() + 1)
+        entropy_r = histogram_entropy(color.red_hist + 1)
+        ctx.record(color_correlation=avg_corr, red_entropy=entropy_r)
         
-        if avg_corr > 0.95 and entropy_r < 6.0:
+        rule = self.scorer.match('color_distribution', ctx.features)
+        if rule == 0:
             return {
                 'type': 'high', 'icon': '🎨', 'title': 'Cores artificialmente correlacionadas',
                 'explain': 'Canais muito sincronizados. IA gera cores harmônicas demais.',
-                'impact': 'ai', 'weight': self.weights['color_distribution'], 'confidence_boost': 20
+                'impact': 'ai', 'weight': self.scorer.weight('color_distribution', rule), 'confidence_boost': 20
             }
-        elif avg_corr < 0.75 and entropy_r > 7.0:
+        elif rule == 1:
             return {
                 'type': 'good', 'icon': '🌈', 'title': 'Distribuição natural',
                 'explain': 'Canais independentes típicos de cenas reais.',
-                'impact': 'real', 'weight': int(self.weights['color_distribution'] * 0.75), 'confidence_boost': 15
+                'impact': 'real', 'weight': self.scorer.weight('color_distribution', rule), 'confidence_boost': 15
             }
         return None
     
-    def _analyze_gradients(self, img):
+    @requires('gray')
+    def _analyze_gradients(self, ctx):
         """Análise de gradientes"""
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        sobelx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-        sobely = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
-        gradient_mag = np.sqrt(sobelx**2 + sobely**2)
+        grad_std, grad_hist = gradient_magnitude_stats(ctx.get('gray'), bins=50)
+        grad_entropy = histogram_entropy(grad_hist + 1)
+        ctx.record(gradient_std=grad_std, gradient_entropy=grad_entropy)
         
-        grad_std = np.std(gradient_mag)
-        grad_hist, _ = np.histogram(gradient_mag.flatten(), bins=50)
-        grad_entropy = stats.entropy(grad_hist + 1)
-        
-        if grad_std < 10 and grad_entropy < 3.0:
+        rule = self.scorer.match('gradient_analysis', ctx.features)
+        if rule == 0:
             return {
                 'type': 'warning', 'icon': '📉', 'title': 'Gradientes suaves',
                 'explain': 'Transições muito uniformes. Pode indicar IA.',
-                'impact': 'ai', 'weight': self.weights['gradient_analysis'], 'confidence_boost': 15
+                'impact': 'ai', 'weight': self.scorer.weight('gradient_analysis', rule), 'confidence_boost': 15
             }
-        elif grad_std > 30 and grad_entropy > 4.0:
+        elif rule == 1:
             return {
                 'type': 'good', 'icon': '📊', 'title': 'Gradientes complexos',
                 'explain': 'Transições complexas de cenas reais.',
-                'impact': 'real', 'weight': int(self.weights['gradient_analysis'] * 0.7), 'confidence_boost': 15
+                'impact': 'real', 'weight': self.scorer.weight('gradient_analysis', rule), 'confidence_boost': 15
             }
         return None
     
-    def _analyze_chromatic_aberration(self, img):
+    @requires('channel_edges')
+    def _analyze_chromatic_aberration(self, ctx):
         """Aberração cromática de lentes"""
-        b, g, r = cv2.split(img)
-        edges_r = cv2.Canny(r, 50, 150)
-        edges_g = cv2.Canny(g, 50, 150)
-        edges_b = cv2.Canny(b, 50, 150)
-        
-        diff_rg = np.abs(edges_r.astype(float) - edges_g.astype(float))
-        diff_rb = np.abs(edges_r.astype(float) - edges_b.astype(float))
-        avg_aberration = (np.mean(diff_rg) + np.mean(diff_rb)) / 2
+        diff_rg, diff_rb = ctx.get('channel_edges')
+        avg_aberration = (diff_rg + diff_rb) / 2
+        ctx.record(chromatic_aberration=avg_aberration)
         
-        if avg_aberration > 2.0:
+        rule = self.scorer.match('chromatic_aberration', ctx.features)
+        if rule == 0:
             return {
                 'type': 'good', 'icon': '🔬', 'title': 'Aberração cromática',
                 'explain': 'Desalinhamento natural de lentes reais.',
-                'impact': 'real', 'weight': self.weights['chromatic_aberration'], 'confidence_boost': 15
+                'impact': 'real', 'weight': self.scorer.weight('chromatic_aberration', rule), 'confidence_boost': 15
             }
-        elif avg_aberration < 0.5:
+        elif rule == 1:
             return {
                 'type': 'warning', 'icon': '⚙️', 'title': 'Perfeição cromática',
                 'explain': 'Canais perfeitamente alinhados. Raro em fotos reais.',
-                'impact': 'ai', 'weight': int(self.weights['chromatic_aberration'] * 0.6), 'confidence_boost': 12
+                'impact': 'ai', 'weight': self.scorer.weight('chromatic_aberration', rule), 'confidence_boost': 12
             }
         return None
     
-    def _analyze_edge_coherence(self, img):
+    @requires('canny')
+    def _analyze_edge_coherence(self, ctx):
         """Coerência de bordas"""
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        edges = cv2.Canny(gray, 50, 150)
+        edges = ctx.get('canny')
         num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(edges, 8)
         
         sizes = stats[1:, cv2.CC_STAT_AREA]
@@ -507,103 +2445,1138 @@ class AIImageDetector:
         
         avg_size = np.mean(sizes)
         size_std = np.std(sizes)
+        ctx.record(edge_mean_size=avg_size, edge_size_std=size_std)
         
-        if size_std < 5 and avg_size < 10:
+        rule = self.scorer.match('edge_coherence', ctx.features)
+        if rule == 0:
             return {
                 'type': 'warning', 'icon': '🧩', 'title': 'Bordas fragmentadas',
                 'explain': 'Bordas desconectadas. Típico de artefatos.',
-                'impact': 'ai', 'weight': self.weights['edge_coherence'], 'confidence_boost': 12
+                'impact': 'ai', 'weight': self.scorer.weight('edge_coherence', rule), 'confidence_boost': 12
             }
-        elif size_std > 50 and avg_size > 30:
+        elif rule == 1:
             return {
                 'type': 'good', 'icon': '🖼️', 'title': 'Estrutura natural',
                 'explain': 'Bordas conectadas naturalmente.',
-                'impact': 'real', 'weight': int(self.weights['edge_coherence'] * 0.7), 'confidence_boost': 12
+                'impact': 'real', 'weight': self.scorer.weight('edge_coherence', rule), 'confidence_boost': 12
             }
         return None
     
-    def _analyze_saturation(self, img_rgb):
+    @requires('color_stats')
+    def _analyze_saturation(self, ctx):
         """Análise de saturação"""
-        hsv = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2HSV)
-        saturation = hsv[:,:,1]
+        color = ctx.get('color_stats')
+        sat_mean = color.saturation_mean
+        sat_std = color.saturation_std
+        ctx.record(saturation_mean=sat_mean, saturation_std=sat_std)
         
-        sat_mean = np.mean(saturation)
-        sat_std = np.std(saturation)
-        
-        if sat_mean > 180 and sat_std < 30:
+        rule = self.scorer.match('saturation_analysis', ctx.features)
+        if rule == 0:
             return {
                 'type': 'warning', 'icon': '🎨', 'title': 'Saturação alta',
                 'explain': 'Cores muito saturadas. IA gera cores vibrantes demais.',
-                'impact': 'ai', 'weight': self.weights['saturation_analysis'], 'confidence_boost': 10
+                'impact': 'ai', 'weight': self.scorer.weight('saturation_analysis', rule), 'confidence_boost': 10
             }
-        elif 80 < sat_mean < 150 and sat_std > 40:
+        elif rule == 1:
             return {
                 'type': 'good', 'icon': '🎬', 'title': 'Saturação natural',
                 'explain': 'Distribuição natural de fotos reais.',
-                'impact': 'real', 'weight': int(self.weights['saturation_analysis'] * 0.6), 'confidence_boost': 10
+                'impact': 'real', 'weight': self.scorer.weight('saturation_analysis', rule), 'confidence_boost': 10
             }
         return None
 
 # Instância global
-detector = AIImageDetector()
+result_cache = None
+if (RESULT_CACHE_SIZE > 0 or REDIS_URL) and not POOL_WORKER:
+    result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL, REDIS_URL)
+phash_index = None
+if PHASH_INDEX_PATH and not POOL_WORKER:
+    phash_index = PerceptualIndex(PHASH_INDEX_PATH, PHASH_MAX_DISTANCE, PHASH_INDEX_MAX_ENTRIES)
+detector = AIImageDetector(cache=result_cache, index=phash_index)
+
+class UploadRejected(Exception):
+    """Upload recusado pelas validações, com o status HTTP da resposta"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+class AdmissionRejected(UploadRejected):
+    """Requisição recusada pelo controle de admissão (429/503 com Retry-After)"""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message, status)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+def rejection_response(e):
+    """Resposta JSON de um UploadRejected (com Retry-After quando é de admissão)"""
+    response = jsonify({'error': str(e)})
+    response.status_code = e.status
+    if isinstance(e, AdmissionRejected):
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+class LocalClientLimits:
+    """Estado por cliente em memória: balde de megapixels e MP em análise"""
+
+    def __init__(self, rate, burst, max_inflight):
+        self.rate = rate
+        self.burst = burst
+        self.max_inflight = max_inflight
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._pruned = time.monotonic()
+
+    def acquire(self, client, cost):
+        """Reserva `cost` MP; retorna (recusa, onde)
+
+        `recusa` é None ou (motivo, MP em análise, espera em s); `onde` diz
+        quem guarda a reserva e volta em release().
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            tokens, updated, inflight = self._clients.get(client, (self.burst, now, 0.0))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if inflight > 0 and inflight + cost > self.max_inflight:
+                self._clients[client] = (tokens, now, inflight)
+                return ('inflight', inflight, 0.0), 'local'
+            # Uma imagem maior que o balde passa com o balde cheio
+            needed = min(cost, self.burst)
+            if tokens < needed:
+                self._clients[client] = (tokens, now, inflight)
+                return ('rate', inflight, (needed - tokens) / self.rate), 'local'
+            self._clients[client] = (tokens - needed, now, inflight + cost)
+            return None, 'local'
+
+    def release(self, client, cost, where='local'):
+        with self._lock:
+            tokens, updated, inflight = self._clients.get(client, (self.burst, time.monotonic(), cost))
+            self._clients[client] = (tokens, updated, max(0.0, inflight - cost))
+
+    def _prune(self, now):
+        # Clientes ociosos com o balde já cheio não precisam de estado
+        if now - self._pruned < 60:
+            return
+        self._pruned = now
+        idle = self.burst / self.rate if self.rate > 0 else 0
+        for client, (tokens, updated, inflight) in list(self._clients.items()):
+            if inflight <= 0 and now - updated > idle:
+                del self._clients[client]
+
+class RedisClientLimits(LocalClientLimits):
+    """Mesmo estado por cliente em Redis, compartilhado entre workers e hosts
+
+    Reserva e liberação atômicas via scripts Lua (relógio do Redis). Falhas
+    no Redis não derrubam a requisição: o limite passa a ser só local (com
+    o CircuitBreaker aberto, sem esperar o Redis) e a reserva é liberada
+    onde foi feita. Se um worker morre com uma reserva aberta, ela expira
+    com a chave (ttl).
+    """
+
+    SCRIPT = """
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'inflight')
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1e6
+    local rate, burst, cost, max_inflight = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    local tokens = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    local inflight = math.max(0, tonumber(state[3]) or 0)
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    local result = {'', tostring(inflight), '0'}
+    if inflight > 0 and inflight + cost > max_inflight then
+        result[1] = 'inflight'
+    elseif tokens < math.min(cost, burst) then
+        result[1] = 'rate'
+        result[3] = tostring((math.min(cost, burst) - tokens) / rate)
+    else
+        tokens = tokens - math.min(cost, burst)
+        inflight = inflight + cost
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now), 'inflight', tostring(inflight))
+    redis.call('EXPIRE', KEYS[1], tonumber(ARGV[5]))
+    return result
+    """
+
+    # Chave já expirada levou a reserva junto: nada a liberar (HINCRBYFLOAT
+    # recriaria a chave sem ttl e com MP em análise negativos)
+    RELEASE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return 0
+    end
+    local inflight = math.max(0, (tonumber(redis.call('HGET', KEYS[1], 'inflight')) or 0) - tonumber(ARGV[1]))
+    redis.call('HSET', KEYS[1], 'inflight', tostring(inflight))
+    redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+    return 1
+    """
+
+    def __init__(self, rate, burst, max_inflight, client, ttl=300):
+        super().__init__(rate, burst, max_inflight)
+        self.ttl = ttl
+        self._redis = client
+        self._script = client.register_script(self.SCRIPT)
+        self._release_script = client.register_script(self.RELEASE_SCRIPT)
+        self.breaker = CircuitBreaker()
+
+    def acquire(self, client, cost):
+        if not self.breaker.allow():
+            return super().acquire(client, cost)
+        try:
+            reason, inflight, wait = self._script(keys=[self._key(client)],
+                                                  args=[self.rate, self.burst, cost, self.max_inflight, self.ttl])
+            self.breaker.succeeded()
+        except Exception:
+            self.breaker.failed()
+            return super().acquire(client, cost)
+        if not reason:
+            return None, 'redis'
+        reason = reason.decode() if isinstance(reason, bytes) else reason
+        return (reason, float(inflight), float(wait)), 'redis'
+
+    def release(self, client, cost, where='local'):
+        if where != 'redis':
+            return super().release(client, cost)
+        # Sem Redis agora: a reserva expira com a chave
+        if not self.breaker.allow():
+            return
+        try:
+            self._release_script(keys=[self._key(client)], args=[cost, self.ttl])
+            self.breaker.succeeded()
+        except Exception:
+            self.breaker.failed()
+
+    def _key(self, client):
+        return f'lumora:admission:{client}'
+
+class AdmissionTicket:
+    """Reserva de uma análise admitida; liberada (uma única vez) ao sair do `with`"""
+
+    def __init__(self, controller, client, cost, where='local'):
+        self.controller = controller
+        self.client = client
+        self.cost = cost
+        self.where = where  # quem guarda a reserva do cliente (LocalClientLimits.acquire)
+        # Só análises completas (MISS) medem a velocidade do worker: o chamador
+        # liga depois do sucesso. Cache, quase-duplicatas e uploads recusados
+        # nas validações custariam quase nada e puxariam a média para zero
+        self.measure = False
+        self.released = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if not self.released:
+            self.released = True
+            self.controller.release(self)
+        return False
+
+class AdmissionController:
+    """Admissão de análises por custo (megapixels decodificados)
+
+    Por worker: a fila estimada é o custo em análise vezes os segundos por
+    megapixel medidos (média móvel da vazão do worker enquanto ocupado, então
+    análises simultâneas não contam em dobro). Acima de ADMISSION_MAX_WAIT a
+    requisição recebe 503. Uma análise com o worker ocioso é sempre admitida.
+    Por cliente: balde de megapixels e teto de MP em análise (429), em
+    memória ou no Redis (client_limits).
+    """
+
+    def __init__(self, max_wait, seconds_per_mp, client_limits, alpha=0.2):
+        self.max_wait = max_wait
+        self.seconds_per_mp = seconds_per_mp
+        self.client_limits = client_limits
+        self.alpha = alpha
+        self.inflight_cost = 0.0
+        self.inflight = 0
+        self.rejected = {429: 0, 503: 0}
+        self._mark = time.monotonic()
+        self._lock = threading.Lock()
+
+    def client_id(self):
+        """Identidade do cliente da requisição atual"""
+        if ADMISSION_CLIENT_HEADER:
+            value = request.headers.get(ADMISSION_CLIENT_HEADER, '').split(',')[0].strip()
+            if value:
+                return value
+        return request.remote_addr or 'unknown'
+
+    def cost(self, data, profile=None):
+        """Megapixels que a análise vai decodificar, lidos só do cabeçalho"""
+        try:
+            _, width, height = probe_image_header(data)
+        except ImageRejected:
+            # Será recusada nas validações; custa o mínimo até lá
+            return ADMISSION_MIN_COST
+        max_dim = ANALYSIS_PROFILES[profile or DEFAULT_PROFILE]['max_dim']
+        if max_dim and max(width, height) > max_dim:
+            scale = max_dim / max(width, height)
+            width, height = width * scale, height * scale
+        return max(ADMISSION_MIN_COST, width * height / 1e6)
+
+    def check_worker(self, cost=0.0):
+        """503 se a fila estimada do worker já passa do limite (antes de ler o corpo)"""
+        with self._lock:
+            self._check_worker(cost)
+
+    def _check_worker(self, cost):
+        wait = (self.inflight_cost + cost) * self.seconds_per_mp
+        if self.inflight and wait > self.max_wait:
+            self.rejected[503] += 1
+            raise AdmissionRejected('Server busy', 503, wait - self.max_wait)
+
+    def admit(self, client, cost):
+        """Reserva a análise ou levanta AdmissionRejected (429/503)"""
+        with self._lock:
+            self._check_worker(cost)
+        denied, where = self.client_limits.acquire(client, cost)
+        if denied is not None:
+            reason, inflight, wait = denied
+            if reason == 'inflight':
+                # Espera até as análises do próprio cliente escoarem
+                wait = inflight * self.seconds_per_mp
+            with self._lock:
+                self.rejected[429] += 1
+            raise AdmissionRejected('Too many requests', 429, wait)
+        self._start(cost)
+        return AdmissionTicket(self, client, cost, where)
+
+    def track(self, cost):
+        """Conta na fila do worker uma análise já admitida em outro processo (jobs no Redis)"""
+        self._start(cost)
+        return AdmissionTicket(self, None, cost)
+
+    def _start(self, cost):
+        with self._lock:
+            if not self.inflight:
+                # Início de um período ocupado: a vazão só conta tempo com trabalho
+                self._mark = time.monotonic()
+            self.inflight += 1
+            self.inflight_cost += cost
+
+    def release(self, ticket):
+        if ticket.client is not None:
+            self.client_limits.release(ticket.client, ticket.cost, ticket.where)
+        with self._lock:
+            now = time.monotonic()
+            if ticket.measure:
+                sample = (now - self._mark) / ticket.cost
+                self.seconds_per_mp += self.alpha * (sample - self.seconds_per_mp)
+            self._mark = now
+            self.inflight -= 1
+            self.inflight_cost = max(0.0, self.inflight_cost - ticket.cost)
+
+def create_admission():
+    """Controle de admissão conforme ADMISSION_*; sem o pacote redis, estado local"""
+    if not ADMISSION_ENABLED or POOL_WORKER:
+        return None
+    limits = None
+    if ADMISSION_BACKEND == 'redis' and REDIS_URL:
+        try:
+            import redis
+            limits = RedisClientLimits(ADMISSION_CLIENT_RATE, ADMISSION_CLIENT_BURST, ADMISSION_CLIENT_MAX_INFLIGHT,
+                                       redis.Redis.from_url(REDIS_URL, socket_timeout=0.5))
+        except ImportError:
+            app.logger.warning("redis não instalado: limites por cliente apenas locais")
+    if limits is None:
+        limits = LocalClientLimits(ADMISSION_CLIENT_RATE, ADMISSION_CLIENT_BURST, ADMISSION_CLIENT_MAX_INFLIGHT)
+    return AdmissionController(ADMISSION_MAX_WAIT, ADMISSION_SECONDS_PER_MP, limits)
+
+admission = create_admission()
+
+def admit_upload(data, profile=None, client=None):
+    """Reserva do controle de admissão para um upload (nullcontext se desligado)
+
+    `client` vem de admission.client_id() quando não há mais requisição
+    ativa (itens de um lote, dentro da resposta em streaming).
+    """
+    if admission is None:
+        return contextlib.nullcontext()
+    return admission.admit(client or admission.client_id(), admission.cost(data, profile))
+
+def requested_profile():
+    """Perfil pedido no formulário ou na query string (?profile=fast)"""
+    profile = request.values.get('profile') or DEFAULT_PROFILE
+    if profile not in ANALYSIS_PROFILES:
+        raise UploadRejected('Invalid profile')
+    return profile
+
+def check_filename(raw_filename):
+    """Validações 2-3: nome de arquivo e extensão; retorna o nome sanitizado"""
+    # Validação 2: Nome de arquivo
+    if not raw_filename:
+        raise UploadRejected('No filename')
+    
+    filename = sanitize_filename(raw_filename)
+    
+    # Validação 3: Extensão
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if ext not in ALLOWED_EXTENSIONS:
+        raise UploadRejected('Invalid file type')
+    return filename
+
+def analyze_upload(filename, image_data, file_type, profile=None, on_result=None, on_schedule=None,
+                   cancel=None):
+    """Validações 5-7 + análise de um upload já lido
+
+    Retorna (result, cache_status), com cache_status HIT, MISS ou NEAR
+    (quase-duplicata no índice perceptual). Sem `file_type` (itens de um zip), o
+    MIME é deduzido da extensão; a assinatura real é checada de qualquer forma.
+    `on_result`, `on_schedule` e `cancel` seguem para detector.analyze_image
+    (resultados parciais e cancelamento).
+    """
+    started = time.perf_counter()
+    file_size = len(image_data)
+    
+    # Validação 5: Tamanho
+    if file_size > 10 * 1024 * 1024:
+        raise UploadRejected('File too large', 413)
+    
+    if file_size < 100:
+        raise UploadRejected('File too small')
+    
+    # Validação 6: MIME type
+    if file_type is None:
+        file_type = 'image/' + filename.rsplit('.', 1)[-1].lower()
+    if file_type not in ALLOWED_MIME_TYPES:
+        raise UploadRejected('Invalid MIME type')
+    
+    # Resultados parciais: o nome do arquivo sai antes de qualquer decodificação
+    if on_result is not None:
+        on_result('filename', detector.filename_result(filename))
+    
+    # Cache: bytes idênticos já foram validados e analisados
+    key = detector.cache_key(image_data, profile)
+    result = detector.cached_result(image_data, filename, profile, key)
+    if result is not None:
+        record_first_request(started)
+        return result, 'HIT'
+    
+    # Validação 7: Segurança da imagem (JPEG grande já decodificado perto da resolução do perfil)
+    max_dim = ANALYSIS_PROFILES[profile or DEFAULT_PROFILE]['max_dim']
+    is_safe, message, decoded = validate_image_safety(image_data, max_dim)
+    if not is_safe:
+        raise UploadRejected(message)
+    
+    # Processar (reaproveita a imagem decodificada na validação)
+    result = detector.analyze_image(image_data, filename, file_size, decoded,
+                                    cache_lookup=False, profile=profile, on_result=on_result, key=key,
+                                    on_schedule=on_schedule, cancel=cancel)
+    record_first_request(started)
+    return result, 'NEAR' if 'nearDuplicate' in result else 'MISS'
 
 @app.route('/analyze', methods=['POST'])
 def analyze():
     """Endpoint de análise com validações de segurança"""
     try:
+        # Worker já saturado: recusa antes de processar o corpo do upload
+        if admission is not None:
+            admission.check_worker()
+        
         # Validação 1: Arquivo presente
         if 'image' not in request.files:
             return jsonify({'error': 'No image provided'}), 400
         
         file = request.files['image']
+        filename = check_filename(file.filename)
+        profile = requested_profile()
         
-        # Validação 2: Nome de arquivo
-        if not file.filename:
-            return jsonify({'error': 'No filename'}), 400
+        # Validação 4: Conteúdo (mapeado do arquivo temporário, sem cópia)
+        with UploadBuffer(file.stream) as upload, admit_upload(upload.data, profile) as ticket:
+            result, cache_status = analyze_upload(filename, upload.data, file.content_type, profile)
+            if ticket is not None:
+                ticket.measure = cache_status == 'MISS'
         
-        filename = sanitize_filename(file.filename)
+        response = jsonify(result)
+        if detector.cache is not None:
+            response.headers['X-Cache'] = cache_status
+        return response
+    
+    except UploadRejected as e:
+        return rejection_response(e)
+    except Exception as e:
+        # SEGURANÇA 11: Erro genérico (não vazar stack trace)
+        return jsonify({'error': 'Processing failed'}), 500
+
+def detach_stream(storage):
+    """Toma posse do stream de um upload
+
+    O Flask fecha os arquivos da requisição quando a view retorna, antes de
+    uma resposta em streaming terminar; o stream passa a ser fechado por nós.
+    """
+    stream, storage.stream = storage.stream, io.BytesIO()
+    return stream
+
+def sse_event(event, data):
+    """Uma mensagem Server-Sent Events com `data` em JSON (uma linha)"""
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+@app.route('/analyze/stream', methods=['POST'])
+def analyze_stream():
+    """/analyze em Server-Sent Events: cada achado assim que o analisador termina
+
+    Eventos: `finding` (analisador e achado), `scores` (placar parcial,
+    aiProbability, analisadores concluídos e agendados) e, por fim, `summary` (o mesmo
+    JSON de /analyze, com `cache`) ou `error`. Cache, quase-duplicatas,
+    perfil tiled e animações vão direto para o `summary`. A admissão é
+    decidida antes do stream abrir (429/503 comuns).
+    """
+    try:
+        if admission is not None:
+            admission.check_worker()
         
-        # Validação 3: Extensão
-        ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
-        if ext not in ALLOWED_EXTENSIONS:
-            return jsonify({'error': 'Invalid file type'}), 400
+        # Validações 1-3 antes de abrir o stream: erros saem como JSON comum
+        if 'image' not in request.files:
+            return jsonify({'error': 'No image provided'}), 400
         
-        # Validação 4: Conteúdo
-        image_data = file.read()
-        file_size = len(image_data)
+        file = request.files['image']
+        filename = check_filename(file.filename)
+        profile = requested_profile()
+    except UploadRejected as e:
+        return rejection_response(e)
+    
+    stream = detach_stream(file)
+    upload = UploadBuffer(stream)
+    try:
+        ticket = admit_upload(upload.data, profile)
+    except AdmissionRejected as e:
+        upload.close()
+        stream.close()
+        return rejection_response(e)
+    file_type = file.content_type
+    events = queue.Queue()
+    # Cliente desconectado: a análise para como num prazo estourado
+    cancel = threading.Event()
+    state = {'running': False, 'closed': False}
+    state_lock = threading.Lock()
+    
+    def release():
+        # Idempotente: ticket e bytes mapeados só são soltos sem análise rodando
+        ticket.__exit__(None, None, None)
+        upload.close()
+        stream.close()
+    
+    def work(data):
+        # Thread própria: a análise não espera o cliente consumir os eventos
+        try:
+            result, cache_status = analyze_upload(filename, data, file_type, profile,
+                                                  lambda name, result: events.put(('result', name, result)),
+                                                  lambda names: events.put(('schedule', names)), cancel)
+            if isinstance(ticket, AdmissionTicket):
+                ticket.measure = cache_status == 'MISS' and not cancel.is_set()
+            events.put(('summary', result, cache_status))
+        except UploadRejected as e:
+            events.put(('error', str(e), e.status))
+        except Exception:
+            # SEGURANÇA 11: Erro genérico (não vazar stack trace)
+            events.put(('error', 'Processing failed', 500))
+        finally:
+            with state_lock:
+                state['running'] = False
+                closed = state['closed']
+            if closed:
+                release()
+    
+    def finish():
+        # Fim do generator ou close() da resposta, que também roda quando o
+        # cliente desconecta antes do generator começar. Sem esperar a
+        # análise: ela é cancelada e quem termina por último solta o upload
+        cancel.set()
+        with state_lock:
+            state['closed'] = True
+            running = state['running']
+        if not running:
+            release()
+    
+    def generate():
+        try:
+            with state_lock:
+                if state['closed']:
+                    return
+                state['running'] = True
+            worker = threading.Thread(target=contextvars.copy_context().run, args=(work, upload.data),
+                                      daemon=True)
+            worker.start()
+            scores = {'ai': 0, 'real': 0}
+            completed = 0
+            # Só o nome do arquivo até a análise agendar os analisadores de conteúdo
+            scheduled = 1
+            
+            def progress():
+                total = scores['ai'] + scores['real']
+                return sse_event('scores', {
+                    'scores': scores,
+                    'aiProbability': scores['ai'] / total * 100 if total > 0 else 50,
+                    'completed': completed,
+                    'total': scheduled,
+                })
+            
+            while True:
+                kind, *payload = events.get()
+                if kind == 'schedule':
+                    scheduled = 1 + len(payload[0])
+                    yield progress()
+                elif kind == 'result':
+                    name, result = payload
+                    completed += 1
+                    if result:
+                        scores[result['impact']] += result['weight']
+                        yield sse_event('finding', {'analyzer': name, 'finding': result})
+                    yield progress()
+                elif kind == 'summary':
+                    result, cache_status = payload
+                    yield sse_event('summary', dict(result, cache=cache_status))
+                    break
+                else:
+                    message, status = payload
+                    yield sse_event('error', {'error': message, 'status': status})
+                    break
+        finally:
+            finish()
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.call_on_close(finish)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Proxies (nginx) não devem acumular os eventos
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def batch_items(streams):
+    """Itens do lote: (nome original, leitor dos bytes, MIME ou None)
+
+    Aceita vários arquivos no campo `images` ou um zip no campo `archive`.
+    O leitor devolve um UploadBuffer; os bytes só são lidos quando o item é
+    processado.
+    """
+    archive = request.files.get('archive')
+    if archive is None:
+        items = []
+        for storage in request.files.getlist('images'):
+            stream = detach_stream(storage)
+            streams.append(stream)
+            items.append((storage.filename, functools.partial(UploadBuffer, stream), storage.content_type))
+        return items
+    
+    import zipfile
+    stream = detach_stream(archive)
+    streams.append(stream)
+    zf = zipfile.ZipFile(stream)
+    
+    def reader(info):
+        # SEGURANÇA: não confiar no tamanho declarado no zip (zip bombs)
+        def read():
+            if info.file_size > 10 * 1024 * 1024:
+                raise UploadRejected('File too large', 413)
+            with zf.open(info) as member:
+                return UploadBuffer(io.BytesIO(member.read(10 * 1024 * 1024 + 1)))
+        return read
+    
+    return [(os.path.basename(info.filename), reader(info), None)
+            for info in zf.infolist() if not info.is_dir()]
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """Análise em lote: uma linha JSON (NDJSON) por imagem, à medida que termina
+
+    Cada item passa pelo controle de admissão como um /analyze: recusado,
+    vira uma linha com status 429/503 e `retryAfter`.
+    """
+    import zipfile
+    streams = []
+    
+    def close_streams():
+        for stream in streams:
+            stream.close()
+    
+    try:
+        client = None
+        if admission is not None:
+            admission.check_worker()
+            client = admission.client_id()
+        profile = requested_profile()
+        items = batch_items(streams)
+    except UploadRejected as e:
+        return rejection_response(e)
+    except zipfile.BadZipFile:
+        close_streams()
+        return jsonify({'error': 'Invalid archive'}), 400
+    
+    if not items or len(items) > BATCH_MAX_ITEMS:
+        close_streams()
+        if not items:
+            return jsonify({'error': 'No image provided'}), 400
+        return jsonify({'error': f'Batch too large (max {BATCH_MAX_ITEMS})'}), 413
+    
+    def generate():
+        try:
+            for index, (raw_filename, read, file_type) in enumerate(items):
+                line = {'index': index, 'filename': sanitize_filename(raw_filename)}
+                try:
+                    filename = check_filename(raw_filename)
+                    with read() as upload, admit_upload(upload.data, profile, client) as ticket:
+                        result, cache_status = analyze_upload(filename, upload.data, file_type, profile)
+                        if ticket is not None:
+                            ticket.measure = cache_status == 'MISS'
+                    line.update(status=200, cache=cache_status, result=result)
+                except UploadRejected as e:
+                    line.update(status=e.status, error=str(e))
+                    if isinstance(e, AdmissionRejected):
+                        line['retryAfter'] = e.retry_after
+                except Exception:
+                    # Erro em um item não derruba o lote
+                    line.update(status=500, error='Processing failed')
+                yield json.dumps(line, ensure_ascii=False) + '\n'
+        finally:
+            close_streams()
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+class JobQueue:
+    """Fila de análises assíncronas em memória, com pool local de workers
+
+    Jobs e fila vivem no processo: use com um único worker do gunicorn (ou
+    JOB_BACKEND=redis), senão a consulta de um job cai em outro processo e
+    responde 404. A fila é limitada (JOB_QUEUE_DEPTH): quando cheia, submit() retorna None
+    e a API responde 503 + Retry-After. Os workers reaproveitam a mesma
+    cadeia de /analyze (analyze_upload -> detector.analyze_image). O
+    AdmissionTicket do job fica com a fila e é liberado quando ele termina:
+    jobs na fila contam na fila estimada do worker.
+    """
+
+    def __init__(self, workers, depth, ttl):
+        self.workers = workers
+        self.ttl = ttl
+        self._queue = queue.Queue(maxsize=depth)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def submit(self, filename, image_data, file_type, profile=None, ticket=None):
+        """Enfileira um upload; retorna o id do job ou None se a fila está cheia
+
+        Aceito, o job assume `ticket` (reserva de admissão); recusado, ela
+        continua com o chamador.
+        """
+        self._ensure_workers()
+        job_id = secrets.token_urlsafe(16)
+        with self._lock:
+            self._expire()
+            self._jobs[job_id] = {'status': 'queued', 'created': time.time()}
+        try:
+            self._queue.put_nowait((job_id, filename, image_data, file_type, profile, ticket))
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job_id]
+            return None
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [k for k, job in self._jobs.items()
+                       if job.get('finished', float('inf')) < cutoff]:
+            del self._jobs[job_id]
+
+    def _ensure_workers(self):
+        """Cria os workers deste processo; True se acabaram de ser criados"""
+        # Threads não sobrevivem ao fork do gunicorn: cria por processo
+        with self._lock:
+            if self._pid == os.getpid():
+                return False
+            self._pid = os.getpid()
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f'lumora-job-{i}', daemon=True).start()
+        return True
+
+    def _work(self):
+        while True:
+            job_id, filename, image_data, file_type, profile, ticket = self._queue.get()
+            with ticket or contextlib.nullcontext():
+                self._update(job_id, status='running')
+                self._update(job_id, finished=time.time(), **run_job(filename, image_data, file_type, profile,
+                                                                     ticket))
+
+class RedisJobQueue(JobQueue):
+    """Mesma API de JobQueue com fila e resultados no Redis
+
+    Permite que qualquer worker do gunicorn consulte qualquer job; cada
+    processo consome a fila compartilhada com seu próprio pool de threads.
+    O job pode rodar em outro processo: a reserva de admissão do cliente é
+    liberada ao enfileirar (o balde de MP fica cobrado) e quem executa
+    conta o job na própria fila (AdmissionController.track).
+
+    Cada job é um hash (um campo JSON por chave: status, result...), sem
+    ler-modificar-gravar. A fila é confiável: BLMOVE passa o job para a
+    lista de processamento e o worker renova uma posse (JOB_LEASE) enquanto
+    roda; um job sem posse (worker morto) volta para a fila até
+    JOB_MAX_ATTEMPTS tentativas. Profundidade e enfileiramento são um único
+    script Lua.
+    """
+
+    QUEUE = 'lumora:jobs:queue'
+    PROCESSING = 'lumora:jobs:processing'
+
+    # KEYS: fila, bytes, job; ARGV: limite, payload, bytes, ttl, campos do job (pares)
+    SUBMIT_SCRIPT = """
+    if redis.call('LLEN', KEYS[1]) >= tonumber(ARGV[1]) then
+        return 0
+    end
+    redis.call('SET', KEYS[2], ARGV[3], 'EX', ARGV[4])
+    redis.call('HSET', KEYS[3], unpack(ARGV, 5))
+    redis.call('EXPIRE', KEYS[3], ARGV[4])
+    redis.call('LPUSH', KEYS[1], ARGV[2])
+    return 1
+    """
+
+    # KEYS: processamento, fila, posse, job; ARGV: payload, máximo de tentativas, erro (JSON)
+    RECOVER_SCRIPT = """
+    if redis.call('EXISTS', KEYS[3]) == 1 then
+        return 0
+    end
+    if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 0 then
+        return 0
+    end
+    local attempts = tonumber(redis.call('HGET', KEYS[4], 'attempts') or '0')
+    if attempts >= tonumber(ARGV[2]) then
+        redis.call('HSET', KEYS[4], 'status', '"failed"', 'error', ARGV[3], 'code', '500')
+        return 2
+    end
+    redis.call('HSET', KEYS[4], 'status', '"queued"')
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    return 1
+    """
+
+    def __init__(self, workers, depth, ttl, client, lease=60, max_attempts=3):
+        super().__init__(workers, depth, ttl)
+        self.depth_limit = depth
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._redis = client
+        self._submit_script = client.register_script(self.SUBMIT_SCRIPT)
+        self._recover_script = client.register_script(self.RECOVER_SCRIPT)
+        self._running = set()
+        self._suspects = set()
+
+    def submit(self, filename, image_data, file_type, profile=None, ticket=None):
+        self._ensure_workers()
+        if ticket is not None:
+            ticket.__exit__(None, None, None)
+        job_id = secrets.token_urlsafe(16)
+        payload = json.dumps({'id': job_id, 'filename': filename, 'type': file_type, 'profile': profile})
+        fields = self._encode(status='queued', created=time.time(), attempts=0)
+        queued = self._submit_script(keys=[self.QUEUE, f'lumora:job:{job_id}:data', f'lumora:job:{job_id}'],
+                                     args=[self.depth_limit, payload, image_data, self.ttl,
+                                           *[item for pair in fields.items() for item in pair]])
+        return job_id if queued else None
+
+    def get(self, job_id):
+        job = self._redis.hgetall(f'lumora:job:{job_id}')
+        if not job:
+            return None
+        job = {key.decode(): json.loads(value) for key, value in job.items()}
+        job.pop('attempts', None)
+        return job
+
+    def depth(self):
+        return self._redis.llen(self.QUEUE)
+
+    @staticmethod
+    def _encode(**fields):
+        return {key: json.dumps(value, ensure_ascii=False) for key, value in fields.items()}
+
+    def _update(self, job_id, **fields):
+        # HSET só dos campos alterados: atualizações concorrentes não se apagam
+        pipe = self._redis.pipeline()
+        pipe.hset(f'lumora:job:{job_id}', mapping=self._encode(**fields))
+        pipe.expire(f'lumora:job:{job_id}', self.ttl)
+        pipe.execute()
+
+    def _ensure_workers(self):
+        if super()._ensure_workers():
+            threading.Thread(target=self._watch, name='lumora-job-lease', daemon=True).start()
+            return True
+        return False
+
+    def _watch(self):
+        """Renova a posse dos jobs deste processo e devolve à fila os órfãos"""
+        while True:
+            time.sleep(max(1, self.lease // 3))
+            try:
+                with self._lock:
+                    running = list(self._running)
+                for job_id in running:
+                    self._redis.set(f'lumora:job:{job_id}:lease', os.getpid(), ex=self.lease)
+                # Órfão só na segunda passada seguida sem posse: o worker que
+                # acabou de tirar o job da fila ainda vai gravar a dele
+                orphans = set()
+                for raw in self._redis.lrange(self.PROCESSING, 0, -1):
+                    job_id = json.loads(raw)['id']
+                    if self._redis.exists(f'lumora:job:{job_id}:lease'):
+                        continue
+                    if raw not in self._suspects:
+                        orphans.add(raw)
+                        continue
+                    recovered = self._recover_script(
+                        keys=[self.PROCESSING, self.QUEUE, f'lumora:job:{job_id}:lease', f'lumora:job:{job_id}'],
+                        args=[raw, self.max_attempts, json.dumps('Processing failed')])
+                    if recovered == 2:
+                        self._redis.delete(f'lumora:job:{job_id}:data')
+                self._suspects = orphans
+            except Exception:
+                continue
+
+    def _work(self):
+        while True:
+            try:
+                # Timeout curto: a thread não fica presa num socket morto
+                raw = self._redis.blmove(self.QUEUE, self.PROCESSING, 5, 'RIGHT', 'LEFT')
+                if raw is None:
+                    continue
+                payload = json.loads(raw)
+                job_id = payload['id']
+                self._redis.set(f'lumora:job:{job_id}:lease', os.getpid(), ex=self.lease)
+                image_data = self._redis.get(f'lumora:job:{job_id}:data')
+            except Exception:
+                time.sleep(1)
+                continue
+            if image_data is None:
+                # Job expirado: nada a executar
+                self._finish(job_id, raw)
+                continue
+            with self._lock:
+                self._running.add(job_id)
+            try:
+                profile = payload.get('profile')
+                ticket = admission.track(admission.cost(image_data, profile)) if admission is not None else None
+                with ticket or contextlib.nullcontext():
+                    self._redis.hincrby(f'lumora:job:{job_id}', 'attempts', 1)
+                    self._update(job_id, status='running')
+                    self._update(job_id, finished=time.time(), **run_job(payload['filename'], image_data,
+                                                                         payload['type'], profile, ticket))
+                self._finish(job_id, raw)
+            except Exception:
+                # Redis fora no meio do job: a posse expira e outro worker o retoma
+                pass
+            finally:
+                with self._lock:
+                    self._running.discard(job_id)
+
+    def _finish(self, job_id, raw):
+        pipe = self._redis.pipeline()
+        pipe.lrem(self.PROCESSING, 1, raw)
+        pipe.delete(f'lumora:job:{job_id}:data', f'lumora:job:{job_id}:lease')
+        pipe.execute()
+
+def run_job(filename, image_data, file_type, profile=None, ticket=None):
+    """Executa um job com a mesma cadeia de /analyze; retorna os campos finais"""
+    try:
+        result, cache_status = analyze_upload(filename, image_data, file_type, profile)
+        if ticket is not None:
+            ticket.measure = cache_status == 'MISS'
+        return {'status': 'done', 'result': result}
+    except UploadRejected as e:
+        return {'status': 'failed', 'error': str(e), 'code': e.status}
+    except Exception:
+        return {'status': 'failed', 'error': 'Processing failed', 'code': 500}
+
+def create_job_queue():
+    """Fila conforme JOB_BACKEND; sem o pacote redis (ou em workers de pool, onde fica ociosa), memória"""
+    if JOB_BACKEND == 'redis' and REDIS_URL and not POOL_WORKER:
+        try:
+            import redis
+            return RedisJobQueue(JOB_WORKERS, JOB_QUEUE_DEPTH, JOB_TTL, redis.Redis.from_url(REDIS_URL),
+                                 JOB_LEASE, JOB_MAX_ATTEMPTS)
+        except ImportError:
+            app.logger.warning("redis não instalado: jobs em memória")
+    return JobQueue(JOB_WORKERS, JOB_QUEUE_DEPTH, JOB_TTL)
+
+job_queue = create_job_queue()
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Enfileira uma análise e retorna o id do job imediatamente"""
+    try:
+        if admission is not None:
+            admission.check_worker()
         
-        # Validação 5: Tamanho
-        if file_size > 10 * 1024 * 1024:
-            return jsonify({'error': 'File too large'}), 413
+        # Validação 1: Arquivo presente
+        if 'image' not in request.files:
+            return jsonify({'error': 'No image provided'}), 400
         
-        if file_size < 100:
-            return jsonify({'error': 'File too small'}), 400
+        file = request.files['image']
+        filename = check_filename(file.filename)
+        profile = requested_profile()
+        image_data = file.read()
         
-        # Validação 6: MIME type
-        file_type = file.content_type
-        if file_type not in ALLOWED_MIME_TYPES:
+        # Validações baratas antes de ocupar a fila; a decodificação fica no worker
+        if len(image_data) > 10 * 1024 * 1024:
+            return jsonify({'error': 'File too large'}), 413
+        if len(image_data) < 100 or not validate_file_signature(image_data):
+            return jsonify({'error': 'Invalid image'}), 400
+        if file.content_type not in ALLOWED_MIME_TYPES:
             return jsonify({'error': 'Invalid MIME type'}), 400
         
-        # Validação 7: Segurança da imagem
-        is_safe, message = validate_image_safety(image_data)
-        if not is_safe:
-            return jsonify({'error': message}), 400
+        # Mesma admissão de /analyze, cobrada na submissão
+        ticket = admit_upload(image_data, profile)
+        job_id = job_queue.submit(filename, image_data, file.content_type, profile,
+                                  ticket if isinstance(ticket, AdmissionTicket) else None)
+        if job_id is None:
+            ticket.__exit__(None, None, None)
+            response = jsonify({'error': 'Queue full'})
+            response.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+            return response, 503
         
-        # Processar
-        result = detector.analyze_image(image_data, filename, file_size)
-        return jsonify(result)
+        response = jsonify({'id': job_id, 'status': 'queued'})
+        response.headers['Location'] = f'/jobs/{job_id}'
+        return response, 202
     
+    except UploadRejected as e:
+        return rejection_response(e)
     except Exception as e:
         # SEGURANÇA 11: Erro genérico (não vazar stack trace)
         return jsonify({'error': 'Processing failed'}), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status e, quando pronto, resultado de um job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'id': job_id, **job})
+
+# Gauges de cache e filas, lidos a cada scrape
+if result_cache is not None:
+    metrics.gauge('lumora_cache_entries', 'Entradas no cache local de resultados', lambda: len(result_cache))
+    metrics.gauge('lumora_cache_hits_total', 'Acertos do cache', lambda: result_cache.hits, 'counter')
+    metrics.gauge('lumora_cache_misses_total', 'Falhas do cache', lambda: result_cache.misses, 'counter')
+if phash_index is not None:
+    metrics.gauge('lumora_phash_index_entries', 'Imagens no índice de quase-duplicatas', lambda: len(phash_index))
+    metrics.gauge('lumora_phash_index_hits_total', 'Resultados reaproveitados de quase-duplicatas',
+                  lambda: phash_index.hits, 'counter')
+metrics.gauge('lumora_job_queue_depth', 'Jobs aguardando na fila', job_queue.depth)
+metrics.gauge('lumora_analysis_pool_queue', 'Analisadores aguardando no pool de threads',
+              lambda: _analysis_pool._work_queue.qsize() if _analysis_pool else 0)
+if admission is not None:
+    metrics.gauge('lumora_admission_inflight_megapixels', 'Megapixels em análise neste worker',
+                  lambda: admission.inflight_cost)
+    metrics.gauge('lumora_admission_seconds_per_megapixel', 'Vazão medida do worker (média móvel)',
+                  lambda: admission.seconds_per_mp)
+    metrics.gauge('lumora_admission_throttled_total', 'Requisições recusadas por limite do cliente (429)',
+                  lambda: admission.rejected[429], 'counter')
+    metrics.gauge('lumora_admission_shed_total', 'Requisições recusadas por worker saturado (503)',
+                  lambda: admission.rejected[503], 'counter')
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Métricas no formato de texto do Prometheus"""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics disabled'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Cold start: aquecimento, duração do import e da primeira análise
+_warmup_done = threading.Event()
+_cold_start = {'warmup': 'pending', 'warmup_seconds': None, 'first_request_seconds': None}
+
+def warmup_images():
+    """PNG e JPEG sintéticos pequenos (gradiente + ruído determinístico)"""
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:128, 0:160]
+    img = np.dstack([xx * 255 // 160, yy * 255 // 128, (xx + yy) * 255 // 288]).astype(np.uint8)
+    img = cv2.add(img, rng.integers(0, 24, img.shape, dtype=np.uint8))
+    return [cv2.imencode(ext, img)[1].tobytes() for ext in ('.png', '.jpg')]
+
+def warm_up():
+    """Roda a cadeia de /analyze uma vez em imagens sintéticas pequenas
+
+    Paga antes do primeiro usuário as inicializações preguiçosas: decoders
+    do PIL/OpenCV, kernels e buffers do OpenCV/NumPy, planos de FFT. Os
+    analisadores rodam em série direto no contexto, sem pools, cache ou
+    índice: seguro no processo mestre do gunicorn --preload.
+    """
+    start = time.perf_counter()
+    try:
+        for data in warmup_images():
+            decoded = decode_image(data)
+            analyzers = [analyzer for _, analyzer in detector.analyzers]
+            ctx = FeatureContext(decoded.pixels, 'warmup.png', decoded.exif, analyzers)
+            dhash(ctx.get('gray'))
+            for analyzer in analyzers:
+                analyzer(ctx)
+                ctx.done(analyzer)
+        _cold_start['warmup'] = 'done'
+    except Exception:
+        # Sem aquecimento o serviço funciona igual, só a primeira requisição paga mais
+        _cold_start['warmup'] = 'failed'
+    finally:
+        _cold_start['warmup_seconds'] = time.perf_counter() - start
+        _warmup_done.set()
+
+def start_warm_up():
+    """Dispara o aquecimento conforme WARMUP (nunca em workers de pool)"""
+    if WARMUP == 'off' or POOL_WORKER:
+        _cold_start['warmup'] = 'off'
+        _warmup_done.set()
+    elif WARMUP == 'sync':
+        warm_up()
+    else:
+        threading.Thread(target=warm_up, name='lumora-warmup', daemon=True).start()
+
+def _resume_warm_up():
+    # Worker criado por fork com o aquecimento ainda rodando no mestre: a thread não veio junto
+    if not _warmup_done.is_set():
+        threading.Thread(target=warm_up, name='lumora-warmup', daemon=True).start()
+
+def record_first_request(started):
+    """Guarda a latência da primeira análise deste processo"""
+    if _cold_start['first_request_seconds'] is None:
+        _cold_start['first_request_seconds'] = time.perf_counter() - started
+
+metrics.gauge('lumora_import_seconds', 'Duração do import do backend', lambda: IMPORT_SECONDS)
+metrics.gauge('lumora_warmup_seconds', 'Duração do aquecimento', lambda: float(_cold_start['warmup_seconds']))
+metrics.gauge('lumora_first_request_seconds', 'Latência da primeira análise do processo',
+              lambda: float(_cold_start['first_request_seconds']))
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check"""
-    return jsonify({'status': 'healthy', 'version': '3.3'})
+    return jsonify({'status': 'healthy', 'version': DETECTOR_VERSION})
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: 200 só depois do aquecimento (o /health responde desde o boot)"""
+    body = {
+        'status': 'ready' if _warmup_done.is_set() else 'warming',
+        'version': DETECTOR_VERSION,
+        'warmup': _cold_start['warmup'],
+        'importSeconds': round(IMPORT_SECONDS, 3),
+        'warmupSeconds': _cold_start['warmup_seconds'] and round(_cold_start['warmup_seconds'], 3),
+        'firstRequestSeconds': _cold_start['first_request_seconds'] and round(_cold_start['first_request_seconds'], 3),
+    }
+    if not _warmup_done.is_set():
+        response = jsonify(body)
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    return jsonify(body)
+
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+start_warm_up()
+os.register_at_fork(after_in_child=_resume_warm_up)
 
 if __name__ == '__main__':
-    print("🛡️ Lumora Backend v3.3 - Detector Avançado de IA [SECURE]")
+    print(f"🛡️ Lumora Backend v{DETECTOR_VERSION} - Detector Avançado de IA [SECURE]")
     print("Servidor rodando em http://localhost:5000")
     print("")
     print("⚠️  ATENÇÃO: Modo DEBUG ativo (apenas para desenvolvimento)")
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Lumora - Benchmark reproduzível do detector e de cada analisador
+
+Gera um corpus sintético determinístico (sem rede, sem arquivos externos),
+mede a latência ponta a ponta (validate_image_safety + analyze_image) e por
+etapa (decode, resize, cada _analyze_*), o pico de RSS, o pico de alocações
+por requisição e imagens/segundo.
+
+Uso:
+    python benchmark.py --output bench.json
+    python benchmark.py --output novo.json --compare bench.json --tolerance 0.2
+    python benchmark.py --memory-budget-mb 400
+    python benchmark.py --quick --crossover
+    python benchmark.py --quick --cold-start --import-budget-ms 800
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import cv2
+
+SEED = 1234
+
+# Lados das imagens comparadas em --crossover (threads vs processos)
+CROSSOVER_SIZES = (256, 512, 1024, 2048, 4096)
+
+# Processo novo por modo de aquecimento: import do backend e duas requisições
+COLD_START_SCRIPT = """
+import io, json, sys, time
+data = open(sys.argv[1], 'rb').read()
+start = time.perf_counter()
+import backend
+import_ms = (time.perf_counter() - start) * 1000
+backend._warmup_done.wait()
+client = backend.app.test_client()
+times = []
+for _ in range(2):
+    start = time.perf_counter()
+    response = client.post('/analyze', data={'image': (io.BytesIO(data), 'cold.jpg', 'image/jpeg')},
+                           content_type='multipart/form-data')
+    times.append((time.perf_counter() - start) * 1000)
+    assert response.status_code == 200, response.status_code
+print(json.dumps({'import_ms': round(import_ms, 1), 'warmup_ms': round((backend._cold_start['warmup_seconds'] or 0) * 1000, 1),
+                  'first_request_ms': round(times[0], 1), 'second_request_ms': round(times[1], 1)}))
+"""
+
+def _noise(rng, size):
+    return rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+
+def _gradient(size):
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    return (np.dstack([xx, yy, (xx + yy) / 2]) * 255).astype(np.uint8)
+
+def _photo_like(rng, size):
+    """Cena suave com formas e ruído de sensor (aproxima uma foto)"""
+    img = cv2.GaussianBlur(_noise(rng, size), (0, 0), size / 256)
+    cv2.rectangle(img, (size // 8, size // 8), (size // 2, size // 3), (30, 180, 90), -1)
+    cv2.circle(img, (2 * size // 3, 2 * size // 3), size // 5, (200, 60, 40), -1)
+    noise = rng.normal(0, 4, img.shape).astype(np.int16)
+    return np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+def _encode(img, ext, params=()):
+    ok, buf = cv2.imencode(ext, img, list(params))
+    if not ok:
+        raise RuntimeError(f'falha ao codificar {ext}')
+    return buf.tobytes()
+
+def _recompress(img, generations, quality=75):
+    """Simula uma imagem re-salva várias vezes em JPEG"""
+    for _ in range(generations):
+        img = cv2.imdecode(np.frombuffer(_encode(img, '.jpg', (cv2.IMWRITE_JPEG_QUALITY, quality)), np.uint8),
+                           cv2.IMREAD_COLOR)
+    return _encode(img, '.jpg', (cv2.IMWRITE_JPEG_QUALITY, quality))
+
+def _gif(img):
+    from PIL import Image
+    import io
+    buf = io.BytesIO()
+    Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)).convert('P', palette=Image.ADAPTIVE).save(buf, 'GIF')
+    return buf.getvalue()
+
+def build_corpus(quick=False):
+    """Corpus determinístico: lista de (nome, arquivo, bytes)"""
+    rng = np.random.default_rng(SEED)
+    photo = _photo_like(rng, 1024)
+    corpus = [
+        ('noise_512_png', 'noise.png', _encode(_noise(rng, 512), '.png')),
+        ('gradient_1024_png', 'gradient.png', _encode(_gradient(1024), '.png')),
+        ('photo_1024_jpeg', 'photo.jpg', _encode(photo, '.jpg', (cv2.IMWRITE_JPEG_QUALITY, 90))),
+        ('photo_1024_jpeg_recompressed', 'photo_recompressed.jpg', _recompress(photo, 3)),
+        ('photo_1024_png', 'photo.png', _encode(photo, '.png')),
+        ('photo_512_gif', 'photo.gif', _gif(cv2.resize(photo, (512, 512), interpolation=cv2.INTER_AREA))),
+    ]
+    if not quick:
+        large = _photo_like(rng, 4096)
+        corpus.append(('photo_4096_jpeg', 'large.jpg', _encode(large, '.jpg', (cv2.IMWRITE_JPEG_QUALITY, 85))))
+    return corpus
+
+def percentiles(samples):
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'mean_ms': round(float(values.mean()), 3),
+    }
+
+def peak_rss_mb():
+    # ru_maxrss: KB no Linux, bytes no macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def run_case(backend, filename, data, repeat):
+    """Executa a cadeia de /analyze `repeat` vezes coletando os tempos por etapa"""
+    totals, stages = [], {}
+    for _ in range(repeat):
+        timings = []
+        token = backend._request_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            is_safe, message, decoded = backend.validate_image_safety(data)
+            if not is_safe:
+                raise RuntimeError(f'{filename}: {message}')
+            result = backend.detector.analyze_image(data, filename, len(data), decoded)
+        finally:
+            backend._request_timings.reset(token)
+        totals.append(time.perf_counter() - start)
+        if result['findings'] and result['findings'][0].get('type') == 'error':
+            raise RuntimeError(f'{filename}: falha na análise')
+        for stage, elapsed in timings:
+            stages.setdefault(stage, []).append(elapsed)
+    return totals, stages
+
+def peak_alloc_mb(backend, filename, data):
+    """Pico de memória alocada em uma requisição (arrays NumPy/OpenCV via tracemalloc)
+
+    Execução separada das cronometradas: o tracemalloc deixa tudo mais lento.
+    """
+    tracemalloc.start()
+    try:
+        run_case(backend, filename, data, 1)
+        return round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+    finally:
+        tracemalloc.stop()
+
+def crossover(backend, repeat):
+    """p50 ponta a ponta com ANALYSIS_EXECUTOR=thread e =process por tamanho de imagem
+
+    `process_wins_from` é o menor lado a partir do qual o pool de processos
+    vence em todos os tamanhos maiores (None se nunca vence).
+    """
+    rng = np.random.default_rng(SEED)
+    original = backend.ANALYSIS_EXECUTOR
+    rows = []
+    try:
+        for size in CROSSOVER_SIZES:
+            data = _encode(_photo_like(rng, size), '.jpg', (cv2.IMWRITE_JPEG_QUALITY, 90))
+            row = {'size': size}
+            for executor in ('thread', 'process'):
+                backend.ANALYSIS_EXECUTOR = executor
+                # Aquecimento: o pool de processos sobe na primeira execução
+                run_case(backend, 'crossover.jpg', data, 1)
+                totals, _ = run_case(backend, 'crossover.jpg', data, repeat)
+                row[executor] = percentiles(totals)['p50_ms']
+            rows.append(row)
+            print(f"{size:5d}px  thread {row['thread']:9.1f} ms  process {row['process']:9.1f} ms")
+    finally:
+        backend.ANALYSIS_EXECUTOR = original
+    
+    wins_from = None
+    for row in reversed(rows):
+        if row['process'] >= row['thread']:
+            break
+        wins_from = row['size']
+    return {'sizes': rows, 'process_wins_from': wins_from}
+
+def cold_start(executor):
+    """Import e primeiras requisições em processos novos, com WARMUP=off e =sync
+
+    Com `sync` o aquecimento entra no import (como no gunicorn --preload) e
+    a primeira requisição deveria custar quase o mesmo que a segunda.
+    """
+    rng = np.random.default_rng(SEED)
+    data = _encode(_photo_like(rng, 1024), '.jpg', (cv2.IMWRITE_JPEG_QUALITY, 90))
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    with tempfile.NamedTemporaryFile(suffix='.jpg') as image:
+        image.write(data)
+        image.flush()
+        for warmup in ('off', 'sync'):
+            env = dict(os.environ, WARMUP=warmup, ANALYSIS_EXECUTOR=executor,
+                       RESULT_CACHE_SIZE='0', METRICS_ENABLED='1')
+            env.pop('REDIS_URL', None)
+            out = subprocess.run([sys.executable, '-c', COLD_START_SCRIPT, image.name], cwd=here, env=env,
+                                 capture_output=True, text=True, check=True).stdout
+            results[warmup] = json.loads(out.strip().splitlines()[-1])
+            row = results[warmup]
+            print(f"WARMUP={warmup:5s} import {row['import_ms']:7.1f} ms  "
+                  f"1ª requisição {row['first_request_ms']:7.1f} ms  2ª {row['second_request_ms']:7.1f} ms")
+    return results
+
+def run(args):
+    # Configuração antes do import: sem cache (mediria só acertos) e com métricas;
+    # sem aquecimento em segundo plano disputando CPU com as medições
+    os.environ['RESULT_CACHE_SIZE'] = '0'
+    os.environ.pop('REDIS_URL', None)
+    os.environ['METRICS_ENABLED'] = '1'
+    os.environ['ANALYSIS_EXECUTOR'] = args.executor
+    os.environ['WARMUP'] = 'off'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import backend
+
+    corpus = build_corpus(args.quick)
+    report = {
+        'meta': {
+            'detector_version': backend.detector.version,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'cpus': os.cpu_count(),
+            'executor': args.executor,
+            'repeat': args.repeat,
+            'seed': SEED,
+        },
+        'cases': {},
+    }
+
+    all_totals = []
+    for name, filename, data in corpus:
+        # Aquecimento: primeira execução paga inicializações preguiçosas
+        run_case(backend, filename, data, 1)
+        totals, stages = run_case(backend, filename, data, args.repeat)
+        all_totals.extend(totals)
+        report['cases'][name] = {
+            'bytes': len(data),
+            'end_to_end': percentiles(totals),
+            'images_per_second': round(len(totals) / sum(totals), 2),
+            'peak_alloc_mb': peak_alloc_mb(backend, filename, data),
+            'stages': {stage: percentiles(samples) for stage, samples in sorted(stages.items())},
+        }
+        print(f"{name:32s} p50 {report['cases'][name]['end_to_end']['p50_ms']:9.1f} ms  "
+              f"p95 {report['cases'][name]['end_to_end']['p95_ms']:9.1f} ms  "
+              f"alloc {report['cases'][name]['peak_alloc_mb']:7.1f} MB")
+
+    report['end_to_end'] = percentiles(all_totals)
+    report['images_per_second'] = round(len(all_totals) / sum(all_totals), 2)
+    report['peak_alloc_mb'] = max(case['peak_alloc_mb'] for case in report['cases'].values())
+    report['peak_rss_mb'] = peak_rss_mb()
+    print(f"{'total':32s} {report['images_per_second']} imagens/s, pico RSS {report['peak_rss_mb']} MB")
+    
+    if args.crossover:
+        print(f"\nThreads ({backend.ANALYSIS_THREADS}) vs processos ({backend.ANALYSIS_PROCESSES}):")
+        report['crossover'] = crossover(backend, args.repeat)
+        wins_from = report['crossover']['process_wins_from']
+        print(f'processos vencem a partir de {wins_from}px' if wins_from else 'processos não vencem threads')
+    
+    if args.cold_start or args.import_budget_ms is not None:
+        print('\nCold start (processo novo):')
+        report['cold_start'] = cold_start(args.executor)
+    return report
+
+def compare(baseline, current, tolerance, min_delta_ms):
+    """Lista etapas cujo p50 piorou além da tolerância relativa e absoluta"""
+    regressions = []
+    for case, data in current['cases'].items():
+        old_case = baseline.get('cases', {}).get(case)
+        if not old_case:
+            continue
+        pairs = [('end_to_end', old_case['end_to_end'], data['end_to_end'])]
+        pairs += [(stage, old_case['stages'][stage], stats)
+                  for stage, stats in data['stages'].items() if stage in old_case['stages']]
+        for stage, old, new in pairs:
+            delta = new['p50_ms'] - old['p50_ms']
+            if delta > min_delta_ms and new['p50_ms'] > old['p50_ms'] * (1 + tolerance):
+                regressions.append(f"{case}/{stage}: {old['p50_ms']:.1f} -> {new['p50_ms']:.1f} ms "
+                                   f"(+{delta / old['p50_ms'] * 100:.0f}%)")
+    return regressions
+
+def over_budget(report, budget_mb):
+    """Casos cujo pico de alocações por requisição passa do orçamento"""
+    return [f"{case}: {data['peak_alloc_mb']:.1f} MB > {budget_mb:.1f} MB"
+            for case, data in report['cases'].items() if data['peak_alloc_mb'] > budget_mb]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark reproduzível do detector Lumora')
+    parser.add_argument('--repeat', type=int, default=5, help='execuções medidas por caso')
+    parser.add_argument('--executor', choices=('serial', 'thread', 'process'), default='serial',
+                        help='modo de execução dos analisadores (serial isola o custo de cada etapa)')
+    parser.add_argument('--quick', action='store_true', help='pula o caso 4096x4096')
+    parser.add_argument('--output', help='arquivo JSON com os resultados')
+    parser.add_argument('--compare', help='JSON de uma execução anterior para checar regressões')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='piora relativa tolerada no p50 (0.2 = 20%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help='ignora pioras absolutas menores que isto (ruído de medição)')
+    parser.add_argument('--crossover', action='store_true',
+                        help='compara threads e processos por tamanho de imagem')
+    parser.add_argument('--memory-budget-mb', type=float,
+                        help='falha se o pico de alocações de alguma requisição passar disto')
+    parser.add_argument('--cold-start', action='store_true',
+                        help='mede import e primeiras requisições em processos novos')
+    parser.add_argument('--import-budget-ms', type=float,
+                        help='falha se o import do backend (WARMUP=off) passar disto; implica --cold-start')
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    failed = False
+    if args.memory_budget_mb is not None:
+        exceeded = over_budget(report, args.memory_budget_mb)
+        if exceeded:
+            print('\n❌ Acima do orçamento de memória por requisição:')
+            for line in exceeded:
+                print(f'   {line}')
+            failed = True
+        else:
+            print(f'\n✅ Pico por requisição dentro de {args.memory_budget_mb:.0f} MB')
+    
+    if args.import_budget_ms is not None:
+        import_ms = report['cold_start']['off']['import_ms']
+        if import_ms > args.import_budget_ms:
+            print(f'\n❌ Import do backend: {import_ms:.0f} ms > {args.import_budget_ms:.0f} ms')
+            failed = True
+        else:
+            print(f'\n✅ Import do backend dentro de {args.import_budget_ms:.0f} ms ({import_ms:.0f} ms)')
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print('\n❌ Regressões de desempenho:')
+            for line in regressions:
+                print(f'   {line}')
+            failed = True
+        else:
+            print('\n✅ Sem regressões além da tolerância')
+    
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Lumora - Varredura offline de acervos de imagens
+
+Percorre uma árvore de diretórios e roda o AIImageDetector em um pool de
+processos (um por núcleo, OpenCV com 1 thread em cada). Grava uma linha CSV
+por imagem com o veredito e as medidas brutas dos analisadores
+(FEATURE_NAMES). O próprio CSV é o checkpoint: ao rodar de novo com a mesma
+saída, imagens já gravadas são puladas.
+
+Com --rescore, um CSV já gerado é repontuado a partir das medidas gravadas
+(regras/pesos atuais ou um modelo logístico em JSON), sem decodificar nada.
+
+Uso:
+    python bulk_scan.py /dados/acervo --output acervo.csv
+    python bulk_scan.py /dados/acervo --output acervo.csv --workers 8 --profile standard
+    python bulk_scan.py --rescore acervo.csv --output repontuado.csv [--model modelo.json]
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+
+BASE_COLUMNS = ['path', 'status', 'error', 'ai_probability', 'confidence', 'score_ai', 'score_real',
+                'width', 'height', 'findings']
+
+backend = None
+
+def init_worker():
+    """Configura o processo antes de importar o backend"""
+    global backend
+    # Paralelismo vem do pool de processos: sem threads extras por processo
+    os.environ['ANALYSIS_EXECUTOR'] = 'serial'
+    os.environ['RESULT_CACHE_SIZE'] = '0'
+    os.environ.pop('REDIS_URL', None)
+    os.environ.pop('PHASH_INDEX_PATH', None)
+    os.environ['METRICS_ENABLED'] = '0'
+    os.environ['WARMUP'] = 'off'
+    import cv2
+    cv2.setNumThreads(1)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import backend as module
+    backend = module
+
+def scan_image(task):
+    """Analisa um arquivo; devolve a linha do CSV (erros viram status=error)"""
+    path, profile = task
+    row = {'path': path, 'status': 'ok'}
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        max_dim = backend.ANALYSIS_PROFILES[profile]['max_dim']
+        is_safe, message, decoded = backend.validate_image_safety(data, max_dim)
+        if not is_safe:
+            raise ValueError(message)
+        features = {}
+        result = backend.detector.analyze_image(data, os.path.basename(path), len(data), decoded,
+                                                cache_lookup=False, profile=profile, features=features)
+        if result['findings'] and result['findings'][0].get('type') == 'error':
+            raise ValueError('falha na análise')
+        row.update(
+            ai_probability=round(result['aiProbability'], 2),
+            confidence=result['confidence'],
+            score_ai=result['scores']['ai'],
+            score_real=result['scores']['real'],
+            width=decoded.width,
+            height=decoded.height,
+            findings='|'.join(finding['title'] for finding in result['findings']),
+        )
+        # Precisão total: o --rescore compara estas medidas com os limiares
+        row.update((name, repr(value)) for name, value in features.items())
+    except Exception as e:
+        row.update(status='error', error=str(e)[:200])
+    return row
+
+def find_images(root, extensions):
+    """Arquivos de imagem sob `root`, em ordem estável"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.rsplit('.', 1)[-1].lower() in extensions:
+                yield os.path.join(dirpath, filename)
+
+def load_checkpoint(output):
+    """Caminhos já gravados na saída; descarta uma última linha incompleta"""
+    if not os.path.exists(output) or os.path.getsize(output) == 0:
+        return set()
+    with open(output, 'rb+') as f:
+        content = f.read()
+        if not content.endswith(b'\n'):
+            # Interrompido no meio de uma linha: volta até a última completa
+            f.truncate(content.rfind(b'\n') + 1)
+    with open(output, newline='', encoding='utf-8') as f:
+        return {row['path'] for row in csv.DictReader(f)}
+
+def rescore(source, output, model=None):
+    """Repontua um CSV de varredura com uma única chamada vetorizada"""
+    import numpy as np
+    with open(source, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        columns = reader.fieldnames
+        rows = list(reader)
+    scored = [row for row in rows if row['status'] == 'ok']
+    features = np.array([[float(row.get(name) or 'nan') for name in backend.FEATURE_NAMES] for row in scored],
+                        dtype=np.float64).reshape(len(scored), len(backend.FEATURE_NAMES))
+    
+    start = time.perf_counter()
+    scorer = backend.LogisticScorer.load(model) if model else backend.detector.scorer
+    scores = scorer.score(features)
+    elapsed = time.perf_counter() - start
+    
+    for i, row in enumerate(scored):
+        row['ai_probability'] = round(float(scores['aiProbability'][i]), 2)
+        if 'ai' in scores:
+            row['score_ai'] = int(scores['ai'][i])
+            row['score_real'] = int(scores['real'][i])
+    with open(output, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, restval='')
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f'{len(scored)} imagens repontuadas em {elapsed * 1000:.1f} ms')
+
+def main():
+    parser = argparse.ArgumentParser(description='Varredura offline de imagens com o detector Lumora')
+    parser.add_argument('root', nargs='?', help='diretório com as imagens (percorrido recursivamente)')
+    parser.add_argument('--output', required=True, help='CSV de resultados (também serve de checkpoint)')
+    parser.add_argument('--workers', type=int,
+                        default=len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count(),
+                        help='processos de análise (padrão: núcleos disponíveis)')
+    parser.add_argument('--profile', default='full', help='perfil de análise (fast, standard, full, tiled)')
+    parser.add_argument('--chunksize', type=int, default=4, help='imagens enviadas por vez a cada processo')
+    parser.add_argument('--rescore', metavar='CSV', help='repontua um CSV já gerado em vez de varrer imagens')
+    parser.add_argument('--model', help='com --rescore: modelo logístico em JSON no lugar das regras')
+    args = parser.parse_args()
+
+    init_worker()
+    if args.rescore:
+        rescore(args.rescore, args.output, args.model)
+        return
+    if not args.root:
+        parser.error('informe o diretório das imagens ou --rescore')
+    if args.profile not in backend.ANALYSIS_PROFILES:
+        parser.error(f'perfil desconhecido: {args.profile}')
+
+    done = load_checkpoint(args.output)
+    pending = [(path, args.profile) for path in find_images(args.root, backend.ALLOWED_EXTENSIONS)
+               if path not in done]
+    print(f'{len(done)} já processadas, {len(pending)} pendentes, {args.workers} processos')
+    if not pending:
+        return
+
+    columns = BASE_COLUMNS + list(backend.FEATURE_NAMES)
+    write_header = not done and not (os.path.exists(args.output) and os.path.getsize(args.output))
+    start = time.perf_counter()
+    with open(args.output, 'a', newline='', encoding='utf-8') as f, \
+            multiprocessing.Pool(args.workers, initializer=init_worker) as pool:
+        writer = csv.DictWriter(f, fieldnames=columns, restval='')
+        if write_header:
+            writer.writeheader()
+        for count, row in enumerate(pool.imap_unordered(scan_image, pending, chunksize=args.chunksize), 1):
+            writer.writerow(row)
+            # Cada linha gravada é um checkpoint
+            f.flush()
+            if count % 100 == 0 or count == len(pending):
+                elapsed = time.perf_counter() - start
+                print(f'{count}/{len(pending)} imagens, {count / elapsed:.1f} imagens/s')
+
+if __name__ == '__main__':
+    main()